@@ -0,0 +1,64 @@
+"""
+Benchmark for Model selection, with and without the cache of selected Models.
+
+Run with: python3 benchmark.py
+"""
+import time
+import tracemalloc
+
+from fstringen import Model
+
+
+def make_spec(components=200, properties=10):
+    return {
+        "components": {
+            f"component{i}": {
+                "properties": {
+                    f"prop{j}": {"type": "string",
+                                 "ref": f"#/components/component{j}"}
+                    for j in range(properties)
+                },
+                "required": [f"prop{j}" for j in range(0, properties, 2)],
+            }
+            for i in range(components)
+        }
+    }
+
+
+def helpers(component):
+    # Generators routinely re-select the same children in several helpers.
+    for _ in range(3):
+        properties = component.select("properties")
+        for prop in properties.select("*"):
+            prop.select("type")
+        component.select("required")
+
+
+def run(spec, cache_size):
+    tracemalloc.start()
+    start = time.perf_counter()
+    model = Model("spec", spec, cache_size=cache_size)
+    for _ in range(3):
+        for component in model.select("/components/*"):
+            helpers(component)
+    elapsed = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, current, peak, model.cache_info()
+
+
+def main():
+    spec = make_spec()
+    for cache_size in (None, 64):
+        elapsed, current, peak, info = run(spec, cache_size)
+        total = info["hits"] + info["misses"]
+        rate = 100 * info["hits"] / total if total else 0
+        print(f"cache_size={cache_size}: {elapsed:.3f}s, "
+              f"memory {current / 2**20:.1f} MiB "
+              f"(peak {peak / 2**20:.1f} MiB), "
+              f"{info['hits']} hits, {info['misses']} misses ({rate:.1f}%), "
+              f"{info['size']} cached Models")
+
+
+if __name__ == "__main__":
+    main()
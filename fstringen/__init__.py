@@ -3,6 +3,10 @@
 
 from .model import *
 from .generator import *
+from .sink import *
+from .cache import *
+from .accessors import *
 
 
-__all__ = model.__all__ + generator.__all__
+__all__ = (model.__all__ + generator.__all__ + sink.__all__ + cache.__all__ +
+           accessors.__all__)
@@ -0,0 +1,144 @@
+import argparse
+import socket
+import sys
+
+from .batch import run_batch
+
+
+def _batch(args):
+    pairs = [tuple(pair) for pair in args.model or ()]
+    if args.pairs:
+        with open(args.pairs) as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                try:
+                    model, outdir = line.split(None, 1)
+                except ValueError:
+                    sys.exit(f"Invalid line in {args.pairs}: '{line}'")
+                pairs.append((model, outdir.strip()))
+    if not pairs:
+        sys.exit("No models given, use --model or --pairs")
+
+    result = run_batch(args.module, pairs, args.processes, args.refprefix)
+    print(result.summary())
+    for failed in result.failed:
+        sys.stderr.write(f"\nError generating {failed['model']}:\n" +
+                         failed["error"] + "\n")
+    return 1 if result.failed else 0
+
+
+def _server():
+    # The server is imported lazily, since it needs Unix sockets, which are
+    # unavailable on some platforms.
+    if not hasattr(socket, "AF_UNIX"):
+        sys.exit("Unix sockets are not available on this platform")
+    from . import server
+    return server
+
+
+def _serve(args):
+    _server().serve(args.socket)
+    return 0
+
+
+def _client(args):
+    if args.stats:
+        data = {"command": "stats"}
+    elif args.shutdown:
+        data = {"command": "shutdown"}
+    elif args.module:
+        data = {"module": args.module, "model": args.model,
+                "refprefix": args.refprefix, "outdir": args.outdir,
+                "targets": args.target}
+    else:
+        sys.exit("No module given, use --stats or --shutdown otherwise")
+
+    try:
+        response = _server().request(args.socket, data)
+    except OSError as e:
+        sys.exit(f"Could not reach the server at {args.socket}: {e}")
+    if not response["ok"]:
+        sys.stderr.write(response["error"] + "\n")
+        return 1
+
+    if "stats" in response:
+        stats = response["stats"]
+        print(f"{stats['requests']} requests ({stats['errors']} failed)")
+        for phase, timing in stats["timings"].items():
+            print(f"{phase:<7} {timing['total']:>9.3f}s total "
+                  f"{timing['mean'] * 1000:>9.3f}ms mean "
+                  f"{timing['max'] * 1000:>9.3f}ms max")
+    elif "files" in response:
+        for fname in response["files"]:
+            print(fname)
+        timings = response["timings"]
+        cached = response["cached"]
+        print(", ".join(
+            f"{phase}: {timings[phase] * 1000:.3f}ms" +
+            (" (cached)" if cached.get(phase) else "")
+            for phase in ("module", "model", "render", "total")),
+            file=sys.stderr)
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m fstringen",
+        description="Run fstringen generators.")
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+
+    batch = commands.add_parser(
+        "batch",
+        help="run the file generators of a module over many models")
+    batch.add_argument("module", help="generator module (a .py file)")
+    batch.add_argument("-m", "--model", nargs=2, action="append",
+                       metavar=("MODEL", "OUTDIR"),
+                       help="model file (JSON or YAML) and the directory for "
+                            "its generated files (can be repeated)")
+    batch.add_argument("-p", "--pairs",
+                       help="file with a model file and an output directory "
+                            "per line")
+    batch.add_argument("-j", "--processes", type=int,
+                       help="number of worker processes (default: number of "
+                            "CPUs)")
+    batch.add_argument("--refprefix", default="#",
+                       help="reference prefix for the models (default: #)")
+    batch.set_defaults(run=_batch)
+
+    server = commands.add_parser(
+        "serve",
+        help="run a server keeping generator modules and models loaded")
+    server.add_argument("socket", help="path of the Unix socket to listen on")
+    server.set_defaults(run=_serve)
+
+    client = commands.add_parser(
+        "client", help="run the file generators of a module on a server")
+    client.add_argument("socket", help="path of the Unix socket of the server")
+    client.add_argument("module", nargs="?",
+                        help="generator module (a .py file)")
+    client.add_argument("-m", "--model",
+                        help="model file (JSON or YAML) to pass to the file "
+                             "generators")
+    client.add_argument("-o", "--outdir", default=".",
+                        help="directory for the generated files (default: "
+                             "current directory)")
+    client.add_argument("-t", "--target", action="append",
+                        help="file to generate (can be repeated, default: "
+                             "all files)")
+    client.add_argument("--refprefix", default="#",
+                        help="reference prefix for the model (default: #)")
+    client.add_argument("--stats", action="store_true",
+                        help="show the timings of all requests served")
+    client.add_argument("--shutdown", action="store_true",
+                        help="stop the server")
+    client.set_defaults(run=_client)
+
+    args = parser.parse_args(argv)
+    return args.run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,286 @@
+import keyword
+
+from .model import (ModelError, _has_items_method, _is_enumerable, _is_model,
+                    _none)
+
+
+class Accessor:
+    """
+    Accessor is the base class of the classes returned by accessor and
+    schema_accessor. An Accessor wraps a Model and exposes the fields known
+    from a sample or a schema as attributes, which read straight from the
+    underlying data: nested objects are wrapped in Accessors, arrays become
+    lists and any other value is returned as a plain Python value. Fields
+    can also be read with accessor[key]. Anything unknown (or missing) falls
+    back to Model.select, as does calling select on the Accessor, and
+    attributes that cannot be found raise AttributeError.
+
+    Fields named like the methods of Accessor (model, select, keys and items)
+    do not become attributes, so they can only be read with accessor[key].
+    """
+
+    __slots__ = ("_data", "_parent", "_key", "_model")
+    _fields = {}  # type: ignore
+    _additional = None
+
+    def __init__(self, model, _parent=None, _key=None):
+        if _parent is None and not _is_model(model):
+            raise ModelError("Accessors can only wrap Models")
+        self._data = model
+        self._parent = _parent
+        self._key = _key
+        self._model = model if _parent is None else None
+
+    @property
+    def model(self):
+        """
+        model is the Model wrapped by this Accessor. For nested Accessors,
+        the Model is only created when first needed.
+        """
+        if self._model is None:
+            self._model = self._parent.model.select(self._key)
+        return self._model
+
+    def select(self, path, default=_none, raw=False):
+        """
+        select is equivalent to Model.select on the wrapped Model.
+        """
+        return self.model.select(path, default, raw)
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return _select(self, name)
+
+    def __getitem__(self, key):
+        try:
+            value = self._data[key]
+        except (KeyError, TypeError):
+            return self.model.select(str(key))
+        return _wrap(self._fields.get(key, self._additional), value, self,
+                     str(key))
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def keys(self):
+        return self._data.keys()
+
+    def items(self):
+        return [(k, self[k]) for k in self._data]
+
+    def __repr__(self):
+        return "{}({!r})".format(type(self).__name__, self._data)
+
+
+def _wrap(spec, value, parent, key):
+    """
+    _wrap wraps value (read from key under parent) according to spec. Values
+    not matching spec (e.g., a null object or array) are returned as they
+    are.
+    """
+    if spec is None:
+        return value
+    kind, arg = spec
+    if kind == "object":
+        if not _has_items_method(value):
+            return value
+        return arg(value, parent, key)
+    if not _is_enumerable(value) or isinstance(value, (str, bytes)):
+        return value
+    return [_wrap(arg, v, parent, "{}/{}".format(key, i))
+            for i, v in enumerate(value)]
+
+
+def _property(key, spec):
+    if spec is None:
+        def get(self):
+            try:
+                return self._data[key]
+            except (KeyError, TypeError):
+                return _select(self, key)
+    else:
+        def get(self):
+            try:
+                value = self._data[key]
+            except (KeyError, TypeError):
+                return _select(self, key)
+            return _wrap(spec, value, self, key)
+    return property(get)
+
+
+def _select(accessor, key):
+    """
+    _select selects key from the Model wrapped by accessor, raising
+    AttributeError if it is missing (so hasattr and getattr with a default
+    work for known fields too).
+    """
+    try:
+        return accessor.model.select(key)
+    except ModelError as e:
+        raise AttributeError(str(e).strip()) from None
+
+
+def _new_class(name):
+    return type(name, (Accessor,), {"__slots__": ()})
+
+
+def _fill_class(cls, fields, additional):
+    cls._fields = fields
+    cls._additional = additional
+    for key, spec in fields.items():
+        if (isinstance(key, str) and key.isidentifier() and
+                not keyword.iskeyword(key) and not hasattr(Accessor, key)):
+            setattr(cls, key, _property(key, spec))
+
+
+def _class_name(key):
+    name = "".join(c for c in str(key).title() if c.isalnum())
+    if not name or not name[0].isalpha():
+        name = "Field" + name
+    return name
+
+
+def _infer(values, name):
+    """
+    _infer returns the accessor spec for a field taking all values in values:
+    ("object", class) for dict-likes, ("array", item spec) for enumerables and
+    None for anything else.
+    """
+    if values and all(_has_items_method(v) for v in values):
+        samples = {}
+        for value in values:
+            for k, v in value.items():
+                samples.setdefault(k, []).append(v)
+        cls = _new_class(name)
+        _fill_class(cls, {k: _infer(v, _class_name(k))
+                          for k, v in samples.items()}, None)
+        return ("object", cls)
+    elif values and all(_is_enumerable(v) and not isinstance(v, (str, bytes))
+                        for v in values):
+        items = [item for value in values for item in value]
+        return ("array", _infer(items, name + "Item"))
+    return None
+
+
+def accessor(sample, name="Accessor"):
+    """
+    accessor returns an Accessor class (named name) for Models shaped like
+    sample, which is a Model or a plain dict-like. Every key found in sample
+    becomes an attribute, and the items of arrays are inferred from all of
+    their elements.
+    """
+    spec = _infer([sample], name)
+    if spec is None or spec[0] != "object":
+        raise ModelError("Accessors can only be created for dict-likes")
+    return spec[1]
+
+
+class _SchemaBuilder:
+    def __init__(self, schema):
+        self.schema = schema
+        self.refs = {}
+
+    def resolve(self, ref):
+        if not ref.startswith("#"):
+            raise ModelError("Only local schema references are supported, "
+                             "got '{}'".format(ref))
+        value = self.schema
+        for part in ref[1:].split("/"):
+            if not part:
+                continue
+            part = part.replace("~1", "/").replace("~0", "~")
+            try:
+                value = value[int(part) if isinstance(value, list) else part]
+            except (KeyError, IndexError, ValueError):
+                raise ModelError(
+                    "Could not resolve schema reference '{}'".format(ref))
+        return value
+
+    def properties(self, schema):
+        """
+        properties returns the properties and additionalProperties of schema,
+        merging those from allOf.
+        """
+        properties = {}
+        additional = None
+        for sub in [schema] + list(schema.get("allOf", ())):
+            if "$ref" in sub:
+                sub = self.resolve(sub["$ref"])
+            if sub is not schema and "allOf" in sub:
+                subprops, subadditional = self.properties(sub)
+            else:
+                subprops = sub.get("properties", {})
+                subadditional = sub.get("additionalProperties")
+            properties.update(subprops)
+            if isinstance(subadditional, dict):
+                additional = subadditional
+        return properties, additional
+
+    def spec(self, schema, name, ref=None):
+        if not isinstance(schema, dict):
+            return None
+        if "$ref" in schema:
+            ref = schema["$ref"]
+            if ref in self.refs:
+                return self.refs[ref]
+            target = self.resolve(ref)
+            return self.spec(target, _class_name(ref.rsplit("/", 1)[-1]),
+                             ref)
+
+        types = schema.get("type")
+        if not isinstance(types, list):
+            types = [types]
+        properties, additional = self.properties(schema)
+        if "object" in types or properties or additional is not None:
+            cls = _new_class(schema.get("title") or name)
+            spec = ("object", cls)
+            # Register referenced schemas before filling them in, so they can
+            # refer to themselves.
+            if ref is not None:
+                self.refs[ref] = spec
+            _fill_class(
+                cls,
+                {k: self.spec(v, _class_name(k))
+                 for k, v in properties.items()},
+                self.spec(additional, name + "Value")
+                if additional is not None else None)
+            return spec
+        elif "array" in types or "items" in schema:
+            if ref is None:
+                return ("array", self.spec(schema.get("items"), name + "Item"))
+            # Referenced arrays are registered (as a list, so the item spec
+            # can be filled in later) before their items, so they can contain
+            # themselves.
+            spec = ["array", None]
+            self.refs[ref] = spec
+            spec[1] = self.spec(schema.get("items"), name + "Item")
+            return spec
+        else:
+            spec = None
+        if ref is not None:
+            self.refs[ref] = spec
+        return spec
+
+
+def schema_accessor(schema, name="Accessor"):
+    """
+    schema_accessor returns an Accessor class for Models following the JSON
+    Schema schema (a dict). Object properties become attributes, and values
+    under additionalProperties are available with accessor[key]. Local
+    references ($ref) and allOf are followed, while other keywords are
+    ignored.
+    """
+    spec = _SchemaBuilder(schema).spec(schema, schema.get("title") or name)
+    if spec is None or spec[0] != "object":
+        raise ModelError("Accessors can only be created for object schemas")
+    return spec[1]
+
+
+__all__ = "Accessor", "accessor", "schema_accessor"
@@ -0,0 +1,143 @@
+import unittest
+
+from .accessors import Accessor, accessor, schema_accessor
+from .model import Model, ModelError, track_reads
+from .model_test import test_model
+
+
+class TestAccessor(unittest.TestCase):
+    def test_sample(self):
+        m = Model("test", test_model, refprefix="$")
+        Component = accessor(m.select("/components/componentB"), "Component")
+        self.assertTrue(issubclass(Component, Accessor))
+        self.assertEqual(Component.__name__, "Component")
+
+        comp = Component(m.select("/components/componentB"))
+        self.assertEqual(comp.properties.name, "componentB")
+        self.assertEqual(comp.properties.age, 9)
+        self.assertIs(comp.properties.dead, True)
+        self.assertEqual(comp.properties.nicknames, ["cB", "compB", "B"])
+        self.assertEqual(comp["properties"]["color"], "red")
+        self.assertEqual(type(comp.properties).__name__, "Properties")
+
+        # Unknown fields fall back to select.
+        compA = Component(m.select("/components/componentA"))
+        self.assertEqual(compA.properties.nothing, None)
+        self.assertEqual(compA.properties.nothing.type, type(None))
+        self.assertEqual(comp.favoriteprop, "$properties/color")
+        self.assertEqual(comp.select("favoriteprop->"), "red")
+        self.assertEqual(comp.properties.select("parent->").name,
+                         "componentA")
+        self.assertEqual(comp.properties.model.path,
+                         "/components/componentB/properties")
+        self.assertRaisesRegex(AttributeError,
+                               "Could not find path 'parent'.*",
+                               lambda: compA.properties.parent)
+        self.assertFalse(hasattr(compA.properties, "parent"))
+        self.assertRaises(AttributeError, getattr, comp, "unknown")
+
+        # Accessor reads are covered by the read of the wrapped Model.
+        with track_reads() as reads:
+            Component(m.select("/components/componentB")).properties.name
+        self.assertEqual(reads, {"/components/componentB"})
+
+    def test_sample_arrays(self):
+        m = Model("test", test_model)
+        Root = accessor(m)
+        root = Root(m)
+        self.assertEqual([a.type for a in root.animals], ["whale", "lion"])
+        self.assertEqual(root.animals[1].model.path, "/animals/1")
+        self.assertEqual(root.week, test_model["week"])
+        self.assertEqual(sorted(root.components.keys()),
+                         ["componentA", "componentB"])
+        self.assertEqual(
+            [c.properties.color for _, c in root.components.items()],
+            ["blue", "red"])
+
+        # Fields named like Accessor methods are only available as items.
+        Clash = accessor({"items": [{"a": 1}], "model": "m"})
+        clash = Clash(Model("test", {"items": [{"a": 2}], "model": "n"}))
+        self.assertTrue(callable(clash.items))
+        self.assertEqual(clash["items"][0].a, 2)
+        self.assertEqual(clash["model"], "n")
+        self.assertEqual(clash.model.path, "/")
+
+        # Values not matching the sample are returned as they are.
+        nulls = Root(Model("test", {"animals": None, "components": None}))
+        self.assertIsNone(nulls.animals)
+        self.assertIsNone(nulls.components)
+
+        self.assertRaisesRegex(ModelError, "Accessors can only be created.*",
+                               accessor, [1, 2])
+        self.assertRaisesRegex(ModelError, "Accessors can only wrap Models",
+                               Root, test_model)
+
+    def test_schema(self):
+        schema = {
+            "title": "Spec",
+            "type": "object",
+            "properties": {
+                "components": {
+                    "type": "object",
+                    "additionalProperties": {"$ref": "#/$defs/component"},
+                },
+                "week": {"type": "array", "items": {"type": "string"}},
+            },
+            "$defs": {
+                "component": {
+                    "allOf": [{"$ref": "#/$defs/base"}],
+                    "properties": {
+                        "properties": {
+                            "type": "object",
+                            "properties": {
+                                "name": {"type": "string"},
+                                "color": {"type": "string"},
+                                "children": {
+                                    "type": "array",
+                                    "items": {"$ref": "#/$defs/component"},
+                                },
+                            },
+                        },
+                    },
+                },
+                "base": {"properties": {"favoriteprop": {"type": "string"}}},
+            },
+        }
+        Spec = schema_accessor(schema)
+        self.assertEqual(Spec.__name__, "Spec")
+
+        m = Model("test", test_model, refprefix="$")
+        spec = Spec(m)
+        compB = spec.components["componentB"]
+        self.assertEqual(type(compB).__name__, "Component")
+        self.assertEqual(compB.properties.color, "red")
+        self.assertEqual(compB.favoriteprop, "$properties/color")
+        self.assertEqual(spec.week[0], "mon")
+        # References to the schema being defined reuse its class.
+        self.assertEqual(type(compB.properties)._fields["children"],
+                         ("array", ("object", type(compB))))
+        self.assertRaisesRegex(AttributeError,
+                               "Could not find path 'children'.*",
+                               lambda: compB.properties.children)
+        self.assertFalse(hasattr(compB.properties, "children"))
+        self.assertIsNone(getattr(compB.properties, "children", None))
+
+        # Arrays can contain themselves through references.
+        Tree = schema_accessor({
+            "type": "object",
+            "properties": {"root": {"$ref": "#/$defs/tree"}},
+            "$defs": {"tree": {"type": "array",
+                               "items": {"$ref": "#/$defs/tree"}}},
+        })
+        tree = Tree._fields["root"]
+        self.assertEqual(tree[0], "array")
+        self.assertIs(tree[1], tree)
+        self.assertEqual(Tree(Model("test", {"root": [[], [[]]]})).root,
+                         [[], [[]]])
+
+        self.assertRaisesRegex(ModelError, "Accessors can only be created.*",
+                               schema_accessor, {"type": "string"})
+        self.assertRaisesRegex(ModelError,
+                               "Only local schema references.*",
+                               schema_accessor,
+                               {"$ref": "http://example.com/schema"})
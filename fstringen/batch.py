@@ -0,0 +1,189 @@
+import hashlib
+import importlib.util
+import json
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+
+from . import generator
+from .model import Model
+from .sink import DirectorySink
+
+
+def load_model(fname, name=None, refprefix="#", **kwargs):
+    """
+    load_model loads a Model from the JSON or YAML (if PyYAML is available)
+    file at fname. The Model is named after the file unless name is given,
+    and other keyword arguments are passed to Model.
+    """
+    with open(fname) as f:
+        if fname.endswith((".yaml", ".yml")):
+            try:
+                import yaml
+            except ImportError:
+                raise ImportError("PyYAML is required to load YAML models")
+            value = yaml.safe_load(f)
+        else:
+            value = json.load(f)
+    if name is None:
+        name = os.path.splitext(os.path.basename(fname))[0]
+    return Model(name, value, refprefix, **kwargs)
+
+
+def load_module(fname):
+    """
+    load_module imports the generator module at fname and returns it. The
+    file generators it defines are kept apart from those of other modules, so
+    they are neither run by generate nor when the interpreter exits. They are
+    stored in the _fstringen_output attribute of the module instead, as a
+    list of (file name, generator options) pairs (see generator._output).
+    """
+    # Modules are named after their absolute path, so that modules with the
+    # same file name in different directories don't replace each other.
+    fname = os.path.abspath(fname)
+    name = "_fstringen_{}_{}".format(
+        os.path.splitext(os.path.basename(fname))[0],
+        hashlib.blake2b(fname.encode(), digest_size=8).hexdigest())
+    spec = importlib.util.spec_from_file_location(name, fname)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    with generator._lock:
+        output = generator._output
+        generator._output = {}
+        try:
+            spec.loader.exec_module(module)
+        except BaseException:
+            del sys.modules[name]
+            raise
+        else:
+            module._fstringen_output = list(generator._output.items())
+        finally:
+            generator._output = output
+    return module
+
+
+class BatchResult:
+    """
+    BatchResult holds the results of run_batch. models is a list with a dict
+    for each (model, outdir) pair, holding the paths, the generated files, the
+    time spent loading and rendering the model, and the error (or None).
+    elapsed is the total wall time, in seconds.
+    """
+
+    def __init__(self, models, elapsed, processes):
+        self.models = models
+        self.elapsed = elapsed
+        self.processes = processes
+
+    @property
+    def failed(self):
+        return [result for result in self.models if result["error"]]
+
+    def summary(self):
+        """
+        summary returns a table with the timings for each model, followed by
+        aggregate timings.
+        """
+        lines = ["{:<40} {:>6} {:>9} {:>9}".format(
+            "model", "files", "load", "render")]
+        for result in self.models:
+            lines.append("{:<40} {:>6} {:>8.3f}s {:>8.3f}s{}".format(
+                result["model"], len(result["files"]), result["load"],
+                result["render"], "  FAILED" if result["error"] else ""))
+
+        count = len(self.models)
+        load = sum(result["load"] for result in self.models)
+        render = sum(result["render"] for result in self.models)
+        files = sum(len(result["files"]) for result in self.models)
+        lines.append("")
+        lines.append(
+            "{} models ({} failed), {} files in {:.3f}s using {} processes "
+            "({:.1f} models/s)".format(
+                count, len(self.failed), files, self.elapsed, self.processes,
+                count / self.elapsed if self.elapsed else 0))
+        if count:
+            lines.append(
+                "load: {:.3f}s total, {:.3f}s mean; "
+                "render: {:.3f}s total, {:.3f}s mean, {:.3f}s max".format(
+                    load, load / count, render, render / count,
+                    max(result["render"] for result in self.models)))
+        return "\n".join(lines)
+
+
+# _module is the generator module loaded by each batch worker process, and
+# _module_fname the file it was loaded from.
+_module = None
+_module_fname = None
+
+
+def _init_worker(module_fname):
+    global _module, _module_fname
+    _module = load_module(module_fname)
+    _module_fname = module_fname
+
+
+def _render(pair, module_fname, refprefix):
+    # Workers load the generator module on their first model (instead of in
+    # an executor initializer, which requires Python 3.7+).
+    if _module_fname != module_fname:
+        _init_worker(module_fname)
+    model_fname, outdir = pair
+    result = {"model": model_fname, "outdir": outdir, "files": [],
+              "load": 0.0, "render": 0.0, "error": None}
+    try:
+        start = time.perf_counter()
+        model = load_model(model_fname, refprefix=refprefix)
+        result["load"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        readsets = generator._generate(
+            _module._fstringen_output, DirectorySink(outdir), None, model,
+            None, None, None)
+        result["render"] = time.perf_counter() - start
+        result["files"] = sorted(readsets)
+    except Exception as e:
+        if isinstance(e, generator.FStringenError):
+            result["error"] = str(e).strip()
+        else:
+            result["error"] = traceback.format_exc()
+    return result
+
+
+def run_batch(module_fname, pairs, processes=None, refprefix="#"):
+    """
+    run_batch runs the file generators of the generator module at
+    module_fname once for each (model file, output directory) pair in pairs,
+    passing the model loaded from that file (see load_model) and writing the
+    files under that directory. Models are distributed over processes worker
+    processes (defaulting to the number of CPUs), each of which imports the
+    generator module only once. If processes is 1, everything runs in the
+    current process.
+
+    run_batch returns a BatchResult. Failing models don't stop the batch,
+    their errors are recorded in the result instead.
+    """
+    global _module, _module_fname
+    pairs = list(pairs)
+    if processes is None:
+        processes = min(os.cpu_count() or 1, max(len(pairs), 1))
+
+    start = time.perf_counter()
+    if processes == 1:
+        previous = _module, _module_fname
+        _init_worker(module_fname)
+        try:
+            results = [_render(pair, module_fname, refprefix)
+                       for pair in pairs]
+        finally:
+            _module, _module_fname = previous
+    else:
+        with ProcessPoolExecutor(processes) as executor:
+            results = list(executor.map(_render, pairs,
+                                        [module_fname] * len(pairs),
+                                        [refprefix] * len(pairs)))
+    return BatchResult(results, time.perf_counter() - start, processes)
+
+
+__all__ = "load_model", "load_module", "run_batch", "BatchResult"
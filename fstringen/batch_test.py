@@ -0,0 +1,118 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import textwrap
+import unittest
+
+from . import generator
+from .batch import load_model, run_batch
+from .generator_test import IsolatedOutput
+
+
+GENERATOR = textwrap.dedent('''
+    from fstringen import gen, Model
+
+    model = Model("default", {"structs": {}})
+
+
+    @gen()
+    def gen_struct(struct):
+        fields = [f"{field.name} {field}" for field in struct.select("*")]
+        return f"""*
+        type {struct.name} struct {{
+            {fields}
+        }}
+        *"""
+
+
+    @gen(model=model, fname="structs.go", preamble="package main\\n\\n")
+    def gen_structs(model):
+        return f"""*
+        {[gen_struct(s) for s in model.select("/structs/*")]}
+        *"""
+
+
+    @gen(model=model, fname="count.txt")
+    def gen_count(model):
+        return str(len(model.select("/structs")))
+''')
+
+
+class TestBatch(IsolatedOutput, unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = self.tmpdir.name
+        self.module = os.path.join(self.path, "structs_gen.py")
+        with open(self.module, "w") as f:
+            f.write(GENERATOR)
+
+        self.pairs = []
+        for i in range(3):
+            fname = os.path.join(self.path, f"spec{i}.json")
+            with open(fname, "w") as f:
+                json.dump({"structs": {f"s{j}": {"id": "int"}
+                                       for j in range(i + 1)}}, f)
+            self.pairs.append((fname, os.path.join(self.path, f"out{i}")))
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+        super().tearDown()
+
+    def read(self, i, fname):
+        with open(os.path.join(self.path, f"out{i}", fname)) as f:
+            return f.read()
+
+    def check_outputs(self):
+        for i in range(3):
+            self.assertEqual(self.read(i, "count.txt"), str(i + 1))
+        self.assertEqual(self.read(0, "structs.go"),
+                         "package main\n\ntype s0 struct {\n    id int\n}")
+
+    def test_load_model(self):
+        m = load_model(self.pairs[0][0], refprefix="$", cache_size=8)
+        self.assertEqual(m.name, "spec0")
+        self.assertEqual(m.refprefix, "$")
+        self.assertEqual(m.select("/structs/s0/id"), "int")
+
+    def test_in_process(self):
+        generator._autogenerate = True
+        result = run_batch(self.module, self.pairs, processes=1)
+        self.assertEqual(result.failed, [])
+        self.assertEqual([r["files"] for r in result.models],
+                         [["count.txt", "structs.go"]] * 3)
+        self.check_outputs()
+        self.assertIn("3 models (0 failed), 6 files", result.summary())
+        # The file generators of the module are not run at exit, while those
+        # of the caller still are.
+        self.assertEqual(generator._output, {})
+        self.assertTrue(generator._autogenerate)
+
+    def test_processes(self):
+        pairs = self.pairs + [(os.path.join(self.path, "missing.json"),
+                               os.path.join(self.path, "missing"))]
+        result = run_batch(self.module, pairs, processes=2)
+        self.check_outputs()
+        self.assertEqual([r["model"] for r in result.failed], [pairs[-1][0]])
+        self.assertIn("FileNotFoundError", result.failed[0]["error"])
+
+    def test_cli(self):
+        pairs_file = os.path.join(self.path, "pairs.txt")
+        with open(pairs_file, "w") as f:
+            f.write("# model outdir\n")
+            for model, outdir in self.pairs[1:]:
+                f.write(f"{model} {outdir}\n")
+        cwd = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        proc = subprocess.run(
+            [sys.executable, "-m", "fstringen", "batch", self.module,
+             "-m", self.pairs[0][0], self.pairs[0][1], "-p", pairs_file,
+             "-j", "2"],
+            cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            universal_newlines=True)
+        self.assertEqual(proc.returncode, 0, proc.stderr)
+        self.assertIn("3 models (0 failed), 6 files", proc.stdout)
+        self.check_outputs()
+        # Nothing is generated on the current directory at exit.
+        self.assertFalse(os.path.exists(os.path.join(cwd, "count.txt")))
@@ -0,0 +1,222 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+from .model import _digest, _is_model, _path_parts, _record_read, track_reads
+
+
+class DiskCache:
+    """
+    DiskCache is a persistent cache for the output of generators, kept as
+    files in the directory at path. Generators opt in by being decorated with
+    gen(cache=...), and are then only rendered if their code or the content of
+    their arguments changed since their output was cached. Models passed as
+    arguments are compared by name and fingerprint, and values read from
+    elsewhere in the same root (e.g., through references or absolute paths)
+    are checked again before cached output is used.
+
+    When the cached files take more than max_size bytes, the least recently
+    used ones are evicted. Hits and misses are counted per generator, see
+    report.
+    """
+
+    def __init__(self, path, max_size=64 * 1024 * 1024):
+        self.path = path
+        self.max_size = max_size
+        self.stats = {}
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+        self._size = sum(entry.stat().st_size for entry in self._entries())
+
+    def _entries(self):
+        return [entry for entry in os.scandir(self.path)
+                if entry.name.endswith(".json")]
+
+    def _wrap(self, fn, name, code):
+        """
+        _wrap returns a version of the generator fn (named name, with source
+        code code) that uses this cache.
+        """
+        code_digest = hashlib.blake2b(code.encode()).digest()
+
+        def cached(*args, **kwargs):
+            key = _key(code_digest, args, kwargs)
+            if key is None:
+                self._count(name, "uncacheable")
+                return fn(*args, **kwargs)
+
+            models = [arg for arg in list(args) + list(kwargs.values())
+                      if _is_model(arg)]
+            roots = {id(model.root): model.root for model in models}
+            entry = self._load(key)
+            if entry is not None and _valid(entry, roots):
+                self._count(name, "hits")
+                for model in models:
+                    _record_read(model._path)
+                for path, _ in entry["deps"]:
+                    _record_read(_path_parts(path))
+                return entry["output"]
+
+            self._count(name, "misses")
+            with track_reads() as reads:
+                output = fn(*args, **kwargs)
+            if output is None or isinstance(output, str):
+                deps = _deps(reads, models, roots)
+                if deps is not None:
+                    self._store(key, {"generator": name, "output": output,
+                                      "deps": deps})
+            return output
+
+        return cached
+
+    def _count(self, name, stat):
+        with self._lock:
+            stats = self.stats.setdefault(
+                name, {"hits": 0, "misses": 0, "uncacheable": 0})
+            stats[stat] += 1
+
+    def _load(self, key):
+        fname = os.path.join(self.path, key + ".json")
+        try:
+            with open(fname) as f:
+                entry = json.load(f)
+            # Keep track of recent use for eviction.
+            os.utime(fname)
+        except (OSError, ValueError):
+            return None
+        return entry
+
+    def _store(self, key, entry):
+        data = json.dumps(entry).encode()
+        fd, tmp = tempfile.mkstemp(suffix=".tmp", dir=self.path)
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, os.path.join(self.path, key + ".json"))
+
+        with self._lock:
+            self._size += len(data)
+            if self._size > self.max_size:
+                self._evict()
+
+    def _evict(self):
+        entries = []
+        for entry in self._entries():
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+        entries.sort()
+
+        self._size = sum(size for _, size, _ in entries)
+        # Evict down to 90% of max_size, so eviction doesn't happen on every
+        # write once the cache is full.
+        for _, size, fname in entries:
+            if self._size <= self.max_size * 0.9:
+                break
+            try:
+                os.unlink(fname)
+            except FileNotFoundError:
+                pass
+            self._size -= size
+
+    def clear(self):
+        """
+        clear removes all entries from the cache.
+        """
+        with self._lock:
+            for entry in self._entries():
+                try:
+                    os.unlink(entry.path)
+                except FileNotFoundError:
+                    pass
+            self._size = 0
+
+    def report(self):
+        """
+        report returns a table with the hits, misses and hit rate of each
+        generator using this cache.
+        """
+        lines = ["{:<30} {:>8} {:>8} {:>11} {:>9}".format(
+            "generator", "hits", "misses", "uncacheable", "hit rate")]
+        with self._lock:
+            stats = sorted(self.stats.items())
+        for name, stat in stats:
+            total = stat["hits"] + stat["misses"] + stat["uncacheable"]
+            rate = 100 * stat["hits"] / total if total else 0
+            lines.append("{:<30} {:>8} {:>8} {:>11} {:>8.1f}%".format(
+                name, stat["hits"], stat["misses"], stat["uncacheable"], rate))
+        return "\n".join(lines)
+
+
+def _arg_digest(value):
+    """
+    _arg_digest returns a content hash of a generator argument, or None if
+    the argument cannot be hashed reliably.
+    """
+    if _is_model(value):
+        h = hashlib.blake2b(digest_size=16)
+        h.update(repr((value.name, value.refprefix)).encode())
+        h.update(bytes.fromhex(value.fingerprint()))
+        return h.digest()
+    elif isinstance(value, (list, tuple)):
+        h = hashlib.blake2b(b"L" if isinstance(value, list) else b"T",
+                            digest_size=16)
+        for v in value:
+            digest = _arg_digest(v)
+            if digest is None:
+                return None
+            h.update(digest)
+        return h.digest()
+    elif (value is None or isinstance(value, (str, bytes, int, float, dict))):
+        return _digest(value, (), None)
+    return None
+
+
+def _key(code_digest, args, kwargs):
+    h = hashlib.blake2b(code_digest, digest_size=20)
+    h.update(repr(sorted(kwargs)).encode())
+    for value in list(args) + [kwargs[k] for k in sorted(kwargs)]:
+        digest = _arg_digest(value)
+        if digest is None:
+            return None
+        h.update(digest)
+    return h.hexdigest()
+
+
+def _deps(reads, models, roots):
+    """
+    _deps returns the paths read outside the Models in models, along with
+    their fingerprints, or None if they cannot be checked later.
+    """
+    covered = {model._path for model in models if not model._detached}
+    deps = []
+    for path in sorted(reads):
+        parts = _path_parts(path)
+        if any(parts[:i] in covered for i in range(len(parts) + 1)):
+            continue
+        # Paths without a single root cannot be checked.
+        if len(roots) != 1:
+            return None
+        root = next(iter(roots.values()))
+        digest = root._fingerprint_at(path)
+        deps.append((path, digest.hex() if digest is not None else None))
+    return deps
+
+
+def _valid(entry, roots):
+    if not entry["deps"]:
+        return True
+    if len(roots) != 1:
+        return False
+    root = next(iter(roots.values()))
+    for path, fingerprint in entry["deps"]:
+        digest = root._fingerprint_at(path)
+        if (digest.hex() if digest is not None else None) != fingerprint:
+            return False
+    return True
+
+
+__all__ = "DiskCache",
@@ -0,0 +1,128 @@
+import copy
+import os
+import sys
+import tempfile
+import unittest
+
+from . import generator, model
+from .cache import DiskCache
+from .generator import _cache_source, gen
+from .model import Model, track_reads
+from .model_test import test_model
+
+
+# Generators cannot use closures, so they record their calls here.
+calls = []
+
+
+class TestDiskCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = self.tmpdir.name
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def make_gen(self, cache):
+        @gen(cache=cache)
+        def gen_component(component):
+            calls.append(component.name)
+            parent = None
+            if component.has("properties/parent"):
+                parent = component.select(
+                    "properties/parent->/properties/name")
+            return f"""*
+            {component.name}: {component.select("properties/color")}
+              parent: {parent}
+            *"""
+
+        return gen_component
+
+    def test_hits(self):
+        m = Model("test", test_model, refprefix="$")
+        calls.clear()
+        gen_component = self.make_gen(DiskCache(self.path))
+        outputs = [gen_component(c) for c in m.select("/components/*")]
+        self.assertEqual(outputs, ["componentA: blue\n  parent: ",
+                                   "componentB: red\n  parent: componentA"])
+        self.assertEqual(calls, ["componentA", "componentB"])
+
+        # A new cache on the same directory (i.e., a new run) hits.
+        calls.clear()
+        cache = DiskCache(self.path)
+        gen_component = self.make_gen(cache)
+        with track_reads() as reads:
+            self.assertEqual(
+                [gen_component(c) for c in m.select("/components/*")],
+                outputs)
+        self.assertEqual(calls, [])
+        self.assertEqual(cache.stats["gen_component"],
+                         {"hits": 2, "misses": 0, "uncacheable": 0})
+        self.assertIn("100.0%", cache.report())
+        # Reads are replayed on hits.
+        self.assertIn("/components/componentA/properties/name", reads)
+        self.assertIn("/components/componentB", reads)
+
+    def test_invalidation(self):
+        m = Model("test", test_model, refprefix="$")
+        calls.clear()
+        gen_component = self.make_gen(DiskCache(self.path))
+        for c in m.select("/components/*"):
+            gen_component(c)
+
+        # componentB depends on the name of componentA, through a reference.
+        data = copy.deepcopy(test_model)
+        data["components"]["componentA"]["properties"]["name"] = "compA"
+        m = Model("test", data, refprefix="$")
+        calls.clear()
+        self.assertEqual(
+            [gen_component(c) for c in m.select("/components/*")],
+            ["componentA: blue\n  parent: ",
+             "componentB: red\n  parent: compA"])
+        self.assertEqual(calls, ["componentA", "componentB"])
+
+        # Models with the same content but a different name miss.
+        calls.clear()
+        gen_component(Model("componentC", data["components"]["componentA"]))
+        self.assertEqual(calls, ["componentC"])
+
+    def test_uncacheable(self):
+        cache = DiskCache(self.path)
+
+        @gen(cache=cache)
+        def gen_obj(obj):
+            return f"""*{obj.__class__.__name__}*"""
+
+        self.assertEqual(gen_obj(object()), "object")
+        self.assertEqual(cache.stats["gen_obj"]["uncacheable"], 1)
+
+    def test_eviction(self):
+        cache = DiskCache(self.path, max_size=2000)
+
+        @gen(cache=cache)
+        def gen_value(value):
+            return f"""*{"x" * 400}{value}*"""
+
+        for i in range(20):
+            gen_value(i)
+        size = sum(os.path.getsize(os.path.join(self.path, f))
+                   for f in os.listdir(self.path))
+        self.assertLessEqual(size, 2000)
+        self.assertGreater(size, 0)
+
+        cache.clear()
+        self.assertEqual(os.listdir(self.path), [])
+
+    def test_code(self):
+        def source(module):
+            with open(module.__file__) as f:
+                return f.read()
+
+        # Cached output is keyed by the code of the generator, of its module,
+        # of the modules next to it that it uses and of fstringen itself.
+        code = _cache_source(self.make_gen, "return 1")
+        self.assertTrue(code.endswith("return 1"))
+        for module in (generator, model, sys.modules[__name__]):
+            self.assertIn(source(module), code)
+        self.assertNotIn(source(copy), code)
+        self.assertNotIn(source(unittest.case), code)
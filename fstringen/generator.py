@@ -1,9 +1,17 @@
 import atexit
 import inspect
+import os
 import re
 import sys
 import textwrap
+import threading
+import time
 import traceback
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from .model import track_reads
+from .sink import DirectorySink
 
 
 class FStringenError(Exception):
@@ -51,14 +59,31 @@ def _put(obj, indent):
         return str(obj).replace("\n", "\n" + indent)
 
 
-def _errmsg(exc_info, fnname, code=None, fstringstar=None):
+def _errmsg(exc_info, fnname, code=None, fstringstar=None, location=None):
+    """
+    _errmsg formats the error in exc_info raised by the generator fnname. If
+    code is not None, it is the source code of the generator, which starts at
+    location (a (filename, line number) tuple). If fstringstar is not None,
+    the error happened rendering that fstringstar, found at location.
+    """
     excl = exc_info[0]
     exc = exc_info[1]
     tb = exc_info[2]
 
-    lineno = traceback.extract_tb(tb)[-1][1] - 1
+    frames = traceback.extract_tb(tb)
+    frame = frames[-1]
+    if code is not None and location is not None:
+        # Point to the line of the generator, even if the error was raised
+        # by something it called.
+        for f in reversed(frames):
+            if f.filename == location[0] and f.name == fnname:
+                frame = f
+                break
+        lineno = frame.lineno - location[1]
+    else:
+        lineno = frame.lineno - 1
     # If we have precise line information, use it
-    line = traceback.extract_tb(tb)[-1][3]
+    line = frame.line
     if fstringstar is None and code is None and line:
         subfn = traceback.extract_tb(tb)[-1][2]
         return f"""
@@ -91,8 +116,11 @@ Error in generator '{fnname}':
 """
 
     if fstringstar is not None:
+        where = ""
+        if location is not None:
+            where = " ({}:{})".format(*location)
         return f"""
-Error generating fstringstar in generator '{fnname}':
+Error generating fstringstar in generator '{fnname}'{where}:
 {"-"*80}
 fstringstar: f\"\"\"*
 {textwrap.dedent(fstringstar).strip()}
@@ -114,23 +142,41 @@ def _normalize_whitespace(fstringstar):
     return fstringstar
 
 
-def _compile(fstringstar):
+# _compiled caches the code of each fstringstar (by location), so the same
+# fstringstar is only parsed once, no matter how many times (or in how many
+# threads) it is rendered.
+_compiled = {}  # type: ignore
+
+
+def _compile(lineno, fstringstar):
     gen_frame = inspect.currentframe().f_back
     globals_ = gen_frame.f_globals
     locals_ = gen_frame.f_locals
+    filename = gen_frame.f_code.co_filename
+    # The fstringstar starts at lineno (passed by the rewritten generator,
+    # since the line of the calling frame is not reliable for calls spanning
+    # many lines), and its first newline is discarded.
+    lineno += fstringstar.startswith("\n")
 
-    fstringstar = _normalize_whitespace(fstringstar)
-    fstring = "_fstringstar = f\"\"\"{}\"\"\"".format(_putify(fstringstar))
     try:
-        exec(fstring, globals_, locals_)
+        key = fstringstar, filename, lineno
+        code = _compiled.get(key)
+        if code is None:
+            fstring = "f\"\"\"{}\"\"\"".format(
+                _putify(_normalize_whitespace(fstringstar)))
+            # Padding the code maps its lines back to the source file.
+            code = compile("\n" * (lineno - 1) + fstring, filename, "eval")
+            _compiled[key] = code
+        # Evaluating (instead of executing an assignment) keeps all state in
+        # this call, without writing to the locals of the generator frame.
+        return eval(code, globals_, locals_)
     except Exception:
         fnname = gen_frame.f_code.co_name
-        msg = _errmsg(sys.exc_info(), fnname, fstringstar=fstringstar)
+        msg = _errmsg(sys.exc_info(), fnname,
+                      fstringstar=_normalize_whitespace(fstringstar),
+                      location=(filename, lineno))
         raise FStringenError(msg) from None
 
-    output = locals_["_fstringstar"]
-    return output
-
 
 _original_excepthook = sys.excepthook
 
@@ -148,7 +194,8 @@ def _exception_handler(exception_type, exception, traceback):
 sys.excepthook = _exception_handler
 
 
-def gen(model=None, fname=None, preamble=None):
+def gen(model=None, fname=None, preamble=None, sink=None, cache=None,
+        postprocess=None):
     """
     gen is a decorator that turns a function or method into a fstringen-powered
     generator.
@@ -156,23 +203,54 @@ def gen(model=None, fname=None, preamble=None):
     If model and fname are passed, the generator will pass model as the first
     and only argument to the decorated function, and write the value returned
     by that function to the file at fname. If preamble is not None, it will be
-    included at the beginning of the generated file.
+    included at the beginning of the generated file. If sink is not None, the
+    file is written to that Sink instead of the current directory.
+
+    If cache (a DiskCache) is not None, the output of the generator is cached
+    across runs, and only rendered again if its arguments, its code, the code
+    of its module or of the modules next to it that it uses, or the rendering
+    code of fstringen change. Changes to other modules it depends on (e.g.,
+    installed packages) are not detected, so the cache should be cleared
+    after updating them.
+
+    If postprocess is not None, it is a list of stages that the generated
+    file (including the preamble) goes through before being written. Each
+    stage is a callable taking the file name and its text, and returning the
+    new text (see the fstringen.postprocess module for some common stages).
+    Stages run in worker threads while the remaining files are rendered.
     """
     def realgen(fn):
         original_name = fn.__name__
-        code = textwrap.dedent(inspect.getsource(fn))
-        newcode = "\n".join(code.split("\n")[1:])  # Remove decorator
+        lines, start = inspect.getsourcelines(fn)
+        filename = inspect.getsourcefile(fn) or "<fstringen>"
+        code = textwrap.dedent("".join(lines)).split("\n")
+        # Remove the decorator, which may span many lines.
+        definition = re.compile(
+            r"\s*(async\s+)?def\s+{}\s*\(".format(re.escape(original_name)))
+        first = next((i for i, line in enumerate(code)
+                      if definition.match(line)), 1)
+        newcode = "\n".join(code[first:])
+        location = filename, start + first
         original_code = newcode
-        newcode = re.sub(r"(f\"\"\"\*)", "_compile(\"\"\"", newcode)
+        newcode = re.sub(
+            r"f\"\"\"\*",
+            lambda m: "_compile({}, \"\"\"".format(
+                location[1] + newcode.count("\n", 0, m.start())),
+            newcode)
         newcode = re.sub(r"(\*\"\"\")", "\"\"\")", newcode)
 
-        # Re-execute function definition with the new code, in its own
-        # globals/locals scope
+        # Re-execute function definition with the new code, in the globals
+        # scope of the decorated function. The code is compiled with the
+        # original file name and line numbers, so tracebacks, profilers and
+        # coverage tools point to the original source.
+        newcode = compile("\n" * (location[1] - 1) + newcode, filename,
+                          "exec")
         globals_ = inspect.currentframe().f_back.f_globals
-        globals_["_put"] = _put
-        globals_["_compile"] = _compile
-        locals_ = inspect.currentframe().f_back.f_locals
-        exec(newcode, globals_, locals_)
+        locals_ = {}
+        with _lock:
+            globals_["_put"] = _put
+            globals_["_compile"] = _compile
+            exec(newcode, globals_, locals_)
         newgen = locals_[original_name]
 
         def newfn(*args, **kwargs):
@@ -183,7 +261,7 @@ def gen(model=None, fname=None, preamble=None):
                 raise e from None
             except Exception:
                 msg = _errmsg(sys.exc_info(), original_name,
-                              code=original_code)
+                              code=original_code, location=location)
                 raise FStringenError(msg) from None
 
             if r is None:
@@ -193,18 +271,26 @@ def gen(model=None, fname=None, preamble=None):
             else:
                 return r
 
-        if model and fname:
-            global _output
-            _output[fname] = {
-                "fn": newfn,
-                "model": model,
-                "preamble": preamble,
-            }
-
-        # Put the new function in globals, so other @gen code can call it.
-        # This is obviously dangerous, and it's one of the the reasons why
-        # fstringen must not be used in anything else other than generators.
-        globals_[original_name] = newfn
+        if cache is not None:
+            newfn = cache._wrap(newfn, original_name,
+                                _cache_source(fn, original_code))
+
+        with _lock:
+            if model and fname:
+                _output[fname] = {
+                    "fn": newfn,
+                    "model": model,
+                    "preamble": preamble,
+                    "sink": sink,
+                    "module": globals_.get("__name__"),
+                    "postprocess": list(postprocess or ()),
+                }
+
+            # Put the new function in globals, so other @gen code can call it.
+            # This is obviously dangerous, and it's one of the the reasons why
+            # fstringen must not be used in anything else other than
+            # generators.
+            globals_[original_name] = newfn
 
         newfn.code = original_code
         return newfn
@@ -212,22 +298,177 @@ def gen(model=None, fname=None, preamble=None):
     return realgen
 
 
+def _source(fname):
+    try:
+        with open(fname) as f:
+            return f.read()
+    except (OSError, TypeError):
+        return ""
+
+
+def _cache_source(fn, code):
+    """
+    _cache_source returns the source code that the output of the generator
+    fn (with code) depends on, for keying cached output: its own code, the
+    code of its module and of the modules in the same directory (or below)
+    referenced by the globals of that module, and the rendering code of
+    fstringen itself. Other imported modules (including those only imported
+    indirectly) are not taken into account.
+    """
+    try:
+        fname = inspect.getsourcefile(fn)
+    except TypeError:
+        fname = None
+    fnames = set()
+    if fname is not None:
+        directory = os.path.dirname(os.path.abspath(fname))
+        for value in list(fn.__globals__.values()):
+            if inspect.ismodule(value):
+                module = value
+            else:
+                module = sys.modules.get(getattr(value, "__module__", None))
+            dependency = getattr(module, "__file__", None)
+            if dependency is None or not dependency.endswith(".py"):
+                continue
+            dependency = os.path.abspath(dependency)
+            if os.path.commonpath([directory, dependency]) == directory:
+                fnames.add(dependency)
+        fnames.discard(os.path.abspath(fname))
+    return "\0".join([_source(__file__), _source(fname)]
+                     + [_source(f) for f in sorted(fnames)] + [code])
+
+
 _output = {}  # type: ignore
+_autogenerate = True
+# _lock guards _output and the globals changed by gen. Rendering itself keeps
+# all its state local, so generators can run concurrently in many threads.
+_lock = threading.RLock()
+
+
+def generate(sink=None, fnames=None, model=None, module=None, workers=None,
+             timings=None):
+    """
+    generate runs all file generators (or only those for the files in fnames)
+    and writes their output. If sink is not None, all files are written to it.
+    Otherwise, each file goes to the sink given to gen, or to a DirectorySink
+    on the current directory. Files only become visible once every generator
+    has succeeded.
+
+    If model is not None, it is passed to the file generators instead of the
+    models given to gen. If module is not None, only file generators defined
+    in the module with that name are run.
+
+    Post-processing stages given to gen run in a pool of worker threads
+    (defaulting to the number of CPUs), overlapping with rendering. If
+    timings is not None, it must be a dict, which is filled with the total
+    time (in seconds) spent in each stage, by stage name.
+
+    generate returns a dict mapping each generated file to its read set: the
+    set of model paths its generator selected (see track_reads).
+
+    Calling generate disables the automatic generation that would otherwise
+    happen when the Python interpreter exits.
+    """
+    global _autogenerate
+    _autogenerate = False
+
+    with _lock:
+        output = list(_output.items())
+    return _generate(output, sink, fnames, model, module, workers, timings)
+
+
+def _generate(output, sink, fnames, model, module, workers, timings):
+    """
+    _generate runs the file generators in output, a list of (file name,
+    generator options) pairs, as described in generate.
+    """
+    default_sink = DirectorySink()
+    sinks = []
+    readsets = {}
+    # Files are written in order, each as soon as it (and every file before
+    # it) is ready.
+    pending = deque()
+    pool = None
+    timings_lock = threading.Lock()
+    try:
+        for fname, genopts in output:
+            if fnames is not None and fname not in fnames:
+                continue
+            if module is not None and genopts["module"] != module:
+                continue
+            target = sink or genopts["sink"] or default_sink
+            if target not in sinks:
+                sinks.append(target)
+            fn = genopts["fn"]
+            with track_reads() as reads:
+                text = fn(genopts["model"] if model is None else model)
+            readsets[fname] = reads
+            text = (genopts["preamble"] or "") + text
+            stages = genopts["postprocess"]
+            if stages:
+                if pool is None:
+                    pool = ThreadPoolExecutor(
+                        workers if workers is not None
+                        else os.cpu_count() or 1)
+                text = pool.submit(_postprocess, fname, text, stages,
+                                   timings, timings_lock)
+            pending.append((target, fname, text))
+            _write_ready(pending, False)
+        _write_ready(pending, True)
+    except BaseException:
+        for _, _, text in pending:
+            if isinstance(text, Future):
+                text.cancel()
+        for target in sinks:
+            target.abort()
+        raise
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    for target in sinks:
+        target.commit()
+    return readsets
+
+
+def _write_ready(pending, wait):
+    """
+    _write_ready writes the files at the start of pending that are ready,
+    waiting for all of them if wait is True.
+    """
+    while pending:
+        target, fname, text = pending[0]
+        if isinstance(text, Future):
+            if not wait and not text.done():
+                return
+            text = text.result()
+        pending.popleft()
+        target.write(fname, text)
+
+
+def _postprocess(fname, text, stages, timings, timings_lock):
+    for stage in stages:
+        name = getattr(stage, "__name__", type(stage).__name__)
+        start = time.perf_counter()
+        try:
+            text = stage(fname, text)
+        except Exception as e:
+            raise FStringenError(
+                "\nError post-processing '{}' in stage '{}': {}: {}\n".format(
+                    fname, name, type(e).__name__, str(e).strip())) from None
+        if timings is not None:
+            elapsed = time.perf_counter() - start
+            with timings_lock:
+                timings[name] = timings.get(name, 0.0) + elapsed
+    return text
 
 
 def _generate_all():
-    for fname in _output:
-        genopts = _output[fname]
-        f = open(fname, "w")
-        if genopts["preamble"]:
-            f.write(genopts["preamble"])
-        fn = genopts["fn"]
-        model = genopts["model"]
-        f.write(fn(model))
-        f.close()
+    if _autogenerate:
+        generate()
 
 
 atexit.register(_generate_all)
 
 
-__all__ = "gen", "FStringenError"
+__all__ = "gen", "generate", "FStringenError"
@@ -1,6 +1,29 @@
+import cProfile
+import inspect
+import pstats
 import unittest
 
-from .generator import gen
+from . import generator
+from .generator import FStringenError, gen
+
+
+class IsolatedOutput:
+    """
+    IsolatedOutput is a TestCase mixin that gives each test an empty set of
+    file generators, restoring the previous ones (and whether they are
+    generated at exit) afterwards.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.output = generator._output
+        self.autogenerate = generator._autogenerate
+        generator._output = {}
+
+    def tearDown(self):
+        generator._output = self.output
+        generator._autogenerate = self.autogenerate
+        super().tearDown()
 
 
 class TestGen(unittest.TestCase):
@@ -232,4 +255,56 @@ class TestGen(unittest.TestCase):
 
         self.assertEqual(fn2(), "abc call:\n    dict: {'x': 1}")
 
+    def test_source_location(self):
+        @gen()
+        def located():
+            a = {}
+            return f"""*
+            start
+            {a["missing"]}
+            *"""
+
+        with self.assertRaises(FStringenError) as cm:
+            located()
+        msg = str(cm.exception)
+        line = inspect.getsourcelines(TestGen.test_source_location)[1] + 5
+        self.assertIn("({}:{})".format(__file__, line), msg)
+        self.assertIn("KeyError", msg)
+
+        @gen()
+        def nested():
+            a = {}
+            return "".join([
+                "x",
+                f"""*
+                {a["missing"]}
+                *""",
+            ])
+
+        with self.assertRaises(FStringenError) as cm:
+            nested()
+        line = inspect.getsourcelines(TestGen.test_source_location)[1] + 22
+        self.assertIn("({}:{})".format(__file__, line), str(cm.exception))
+
+        @gen()
+        def failing():
+            a = 1
+            return a / 0
+
+        with self.assertRaises(FStringenError) as cm:
+            failing()
+        self.assertIn("return a / 0 <- ZeroDivisionError",
+                      str(cm.exception))
+
+    def test_profile(self):
+        @gen()
+        def profiled():
+            return f"""*
+            {1 + 1}
+            *"""
 
+        profile = cProfile.Profile()
+        profile.runcall(profiled)
+        stats = pstats.Stats(profile).stats
+        line = inspect.getsourcelines(TestGen.test_profile)[1] + 2
+        self.assertIn((__file__, line, "profiled"), stats)
@@ -0,0 +1,92 @@
+import json
+
+from . import generator
+from .model import _path_parts
+
+
+def stale(readsets, changed):
+    """
+    stale returns the set of files (keys in readsets) whose read set
+    intersects the changed paths, i.e., that read a changed path, one of its
+    ancestors or one of its descendants. A read path ending in * (recorded
+    when * is used in the middle of a path) only depends on the keys of the
+    iterated value, so it only intersects changes to its direct children.
+    Files with an empty read set are always stale, since their generators
+    may have read the Model without selecting anything (e.g., through direct
+    dict or list access).
+    """
+    changed = {_path_parts(path) for path in changed}
+    prefixes = set()
+    for path in changed:
+        for i in range(len(path) + 1):
+            prefixes.add(path[:i])
+    parents = {path[:-1] for path in changed if path}
+
+    result = set()
+    for fname, reads in readsets.items():
+        if not reads:
+            result.add(fname)
+            continue
+        for read in reads:
+            read = _path_parts(read)
+            if read and read[-1] == "*":
+                read = read[:-1]
+                if read in parents or any(read[:i] in changed
+                                          for i in range(len(read) + 1)):
+                    result.add(fname)
+                    break
+            elif read in prefixes or any(read[:i] in changed
+                                         for i in range(len(read))):
+                result.add(fname)
+                break
+    return result
+
+
+def load_readsets(fname):
+    """
+    load_readsets loads read sets saved with save_readsets. An empty dict is
+    returned if the file does not exist.
+    """
+    try:
+        with open(fname) as f:
+            return {k: set(v) for k, v in json.load(f).items()}
+    except FileNotFoundError:
+        return {}
+
+
+def save_readsets(fname, readsets):
+    """
+    save_readsets saves readsets (a dict mapping generated files to the set
+    of paths their generators read, as returned by generate) to fname.
+    """
+    with open(fname, "w") as f:
+        json.dump({k: sorted(v) for k, v in readsets.items()}, f, indent=1,
+                  sort_keys=True)
+
+
+def regenerate(old_model, new_model, readsets_file, sink=None):
+    """
+    regenerate runs only the file generators that may produce different
+    output now that old_model became new_model, and returns their files.
+
+    File generators registered with new_model are skipped if their saved read
+    set (in readsets_file) does not intersect the paths that changed between
+    both Models. File generators without a saved read set, with an empty one
+    or registered with other Models always run. Only reads through select
+    (and the methods built on it) are tracked: direct dict or list access,
+    such as model["week"], and Accessor reads over the root Model are not,
+    so generators relying on them may be wrongly skipped unless they also
+    select the paths they use. The read sets of the generated files are merged
+    back into readsets_file.
+    """
+    readsets = load_readsets(readsets_file)
+    skip = set(readsets) - stale(readsets, old_model.diff(new_model))
+    fnames = [fname for fname, genopts in generator._output.items()
+              if fname not in skip or genopts["model"] is not new_model]
+
+    readsets.update(generator.generate(sink, fnames))
+    save_readsets(readsets_file, readsets)
+    return fnames
+
+
+__all__ = "stale", "load_readsets", "save_readsets", "regenerate"
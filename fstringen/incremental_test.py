@@ -0,0 +1,115 @@
+import copy
+import os
+import tempfile
+import unittest
+
+from .generator import gen
+from .generator_test import IsolatedOutput
+from .incremental import load_readsets, regenerate, stale
+from .model import Model
+from .model_test import test_model
+from .sink import MemorySink
+
+
+class TestIncremental(IsolatedOutput, unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+        super().tearDown()
+
+    def test_stale(self):
+        readsets = {
+            "a": {"/components/componentA"},
+            "b": {"/components"},
+            "c": {"/components/componentB/properties/color", "/week"},
+        }
+        self.assertEqual(stale(readsets, set()), set())
+        self.assertEqual(stale(readsets, {"/week/0"}), {"c"})
+        self.assertEqual(stale(readsets, {"/components/componentA/age"}),
+                         {"a", "b"})
+        self.assertEqual(stale(readsets, {"/components"}), {"a", "b", "c"})
+        self.assertEqual(stale(readsets, {"/"}), {"a", "b", "c"})
+
+        readsets = {"keys": {"/components/*"}}
+        self.assertEqual(stale(readsets, {"/components/componentA/age"}),
+                         set())
+        self.assertEqual(stale(readsets, {"/components/componentC"}),
+                         {"keys"})
+        self.assertEqual(stale(readsets, {"/components"}), {"keys"})
+        self.assertEqual(stale(readsets, {"/"}), {"keys"})
+
+        # Empty read sets are unknown, so they are always stale.
+        readsets = {"direct": set(), "week": {"/week"}}
+        self.assertEqual(stale(readsets, set()), {"direct"})
+        self.assertEqual(stale(readsets, {"/week"}), {"direct", "week"})
+
+    def test_regenerate(self):
+        readsets_file = os.path.join(self.tmpdir.name, "readsets.json")
+        old = Model("test", test_model, refprefix="$")
+        new_model = copy.deepcopy(test_model)
+        new_model["components"]["componentA"]["properties"]["color"] = "pink"
+        new = Model("test", new_model, refprefix="$")
+
+        @gen()
+        def gen_component(component):
+            return f"""*{component.select("properties/color")}*"""
+
+        def register(model):
+            @gen(model=model, fname="a.txt")
+            def gen_a(model):
+                return gen_component(model.select("/components/componentA"))
+
+            @gen(model=model, fname="b.txt")
+            def gen_b(model):
+                return gen_component(model.select(
+                    "/components/componentB/properties/parent->"))
+
+            @gen(model=model, fname="week.txt")
+            def gen_week(model):
+                return f"""*{model.select("/week")}*"""
+
+        register(old)
+        sink = MemorySink()
+        self.assertEqual(regenerate(old, old, readsets_file, sink),
+                         ["a.txt", "b.txt", "week.txt"])
+        self.assertEqual(sink.files["a.txt"], "blue")
+        self.assertEqual(load_readsets(readsets_file)["b.txt"], {
+            "/components/componentB/properties/parent",
+            "/components/componentA",
+            "/components/componentA/properties/color",
+        })
+
+        # Only files reading componentA are regenerated.
+        register(new)
+        self.assertEqual(regenerate(old, new, readsets_file, sink),
+                         ["a.txt", "b.txt"])
+        self.assertEqual(sink.files["a.txt"], "pink")
+        self.assertEqual(sink.files["b.txt"], "pink")
+        self.assertEqual(sink.files["week.txt"], "mon\ntue\nwed\nthu\nfri")
+
+    def test_regenerate_direct_access(self):
+        readsets_file = os.path.join(self.tmpdir.name, "readsets.json")
+        old = Model("test", test_model, refprefix="$")
+        new_model = copy.deepcopy(test_model)
+        new_model["week"] = ["sat", "sun"]
+        new = Model("test", new_model, refprefix="$")
+
+        def register(model):
+            @gen(model=model, fname="week.txt")
+            def gen_week(model):
+                return f"""*{model["week"]}*"""
+
+        register(old)
+        sink = MemorySink()
+        self.assertEqual(regenerate(old, old, readsets_file, sink),
+                         ["week.txt"])
+        self.assertEqual(load_readsets(readsets_file)["week.txt"], set())
+
+        # Nothing was selected, so the file is always regenerated.
+        register(new)
+        self.assertEqual(regenerate(old, new, readsets_file, sink),
+                         ["week.txt"])
+        self.assertEqual(sink.files["week.txt"], "sat\nsun")
@@ -1,12 +1,103 @@
+import copy
 import unittest
+from concurrent.futures import ThreadPoolExecutor
 
-from .generator import gen
-from .model import Model
+from . import generator
+from .generator import gen, generate
+from .generator_test import IsolatedOutput
+from .model import Model, track_reads
 from .model_test import test_model
+from .postprocess import license_header, line_endings
+from .sink import MemorySink
 
 
-class TestIntegration(unittest.TestCase):
-    # TODO: test file generation
+class TestIntegration(IsolatedOutput, unittest.TestCase):
+    def test_generate(self):
+        m = Model("test", test_model)
+        sink = MemorySink()
+
+        @gen(model=m, fname="colors.txt", preamble="# colors\n", sink=sink)
+        def gen_colors(model):
+            colors = [c.select("properties/color")
+                      for c in model.select("/components/*")]
+            return f"""*
+            {colors}
+            *"""
+
+        @gen(model=m, fname="week.txt", sink=sink)
+        def gen_week(model):
+            return f"""*{model.select("/week")}*"""
+
+        generate()
+        self.assertFalse(generator._autogenerate)
+        self.assertEqual(sink.files, {
+            "colors.txt": "# colors\nblue\nred",
+            "week.txt": "mon\ntue\nwed\nthu\nfri",
+        })
+
+        # A sink passed to generate overrides the ones given to gen.
+        other = MemorySink()
+        generate(other)
+        self.assertEqual(other.files, sink.files)
+
+    def test_generate_error(self):
+        m = Model("test", test_model)
+        sink = MemorySink()
+
+        @gen(model=m, fname="ok.txt", sink=sink)
+        def gen_ok(model):
+            return "ok"
+
+        @gen(model=m, fname="broken.txt", sink=sink)
+        def gen_broken(model):
+            return model.select("/doesnotexist")
+
+        self.assertRaises(generator.FStringenError, generate)
+        # Nothing is written when any generator fails.
+        self.assertEqual(sink.files, {})
+
+    def test_generate_postprocess(self):
+        m = Model("test", test_model)
+        sink = MemorySink()
+
+        def upper(fname, text):
+            return text.upper()
+
+        @gen(model=m, fname="week.txt", preamble="# week\r\n", sink=sink,
+             postprocess=[upper, line_endings()])
+        def gen_week(model):
+            return f"""*{model.select("/week")}*"""
+
+        @gen(model=m, fname="plain.txt", sink=sink)
+        def gen_plain(model):
+            return "plain"
+
+        timings = {}
+        generate(timings=timings)
+        self.assertEqual(sink.files, {
+            "week.txt": "# WEEK\nMON\nTUE\nWED\nTHU\nFRI\n",
+            "plain.txt": "plain",
+        })
+        self.assertEqual(sorted(timings), ["line_endings", "upper"])
+
+    def test_generate_postprocess_error(self):
+        m = Model("test", test_model)
+        sink = MemorySink()
+
+        @gen(model=m, fname="ok.txt", sink=sink)
+        def gen_ok(model):
+            return "ok"
+
+        @gen(model=m, fname="unlicensed.txt", sink=sink,
+             postprocess=[license_header("MIT\n", check=True)])
+        def gen_unlicensed(model):
+            return "text"
+
+        with self.assertRaises(generator.FStringenError) as cm:
+            generate()
+        self.assertIn("'unlicensed.txt' in stage 'license_header'",
+                      str(cm.exception))
+        self.assertEqual(sink.files, {})
 
     def test_gen_select(self):
         @gen()
@@ -60,3 +151,77 @@ class TestIntegration(unittest.TestCase):
     - compB
     - B
 """)
+
+
+class TestConcurrency(IsolatedOutput, unittest.TestCase):
+    def models(self, n):
+        models = []
+        for i in range(n):
+            data = copy.deepcopy(test_model)
+            data["components"]["componentA"]["properties"]["age"] = i
+            data["week"] = data["week"][:i % 5 + 1]
+            models.append(Model(f"test{i}", data, refprefix="$"))
+        return models
+
+    def test_render_threads(self):
+        @gen()
+        def gen_component(component):
+            age = component.select("properties/age")
+            return f"""*
+            {component.name}:
+              age: {age}
+              nicknames:
+                {list(component.select("properties/nicknames"))}
+            *"""
+
+        @gen()
+        def gen_all(model):
+            week = model.select("/week")
+            return f"""*
+            {[gen_component(c) for c in model.select("/components/*")]}
+            week: {len(week)}
+              {week}
+            *"""
+
+        models = self.models(50)
+        expected = [gen_all(m) for m in models]
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            for _ in range(5):
+                results = list(executor.map(gen_all, models))
+                self.assertEqual(results, expected)
+
+    def test_track_reads_threads(self):
+        models = self.models(20)
+
+        def read(i):
+            with track_reads() as reads:
+                for _ in range(20):
+                    models[i].select(f"/week/{i % 5}", None)
+            return reads
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(read, range(len(models))))
+        self.assertEqual(results, [{f"/week/{i % 5}"}
+                                   for i in range(len(models))])
+
+    def test_generate_threads(self):
+        m = Model("test", test_model)
+
+        @gen(model=m, fname="colors.txt")
+        def gen_colors(model):
+            return f"""*{model.select("/components/*/properties/color")}*"""
+
+        def run(_):
+            sink = MemorySink()
+            readsets = generate(sink)
+            return sink.files, readsets
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(run, range(32)))
+        for files, readsets in results:
+            self.assertEqual(files, {"colors.txt": "blue\nred"})
+            self.assertEqual(readsets["colors.txt"], {
+                "/components/*",
+                "/components/componentA/properties/color",
+                "/components/componentB/properties/color",
+            })
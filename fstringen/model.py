@@ -1,3 +1,12 @@
+import bisect
+import collections
+import collections.abc
+import contextlib
+import hashlib
+import threading
+import weakref
+
+
 class ModelError(Exception):
     """
     ModelError represents an error in navigating a model with Model.select.
@@ -15,6 +24,11 @@ def _is_enumerable(obj):
         return True
 
 
+def _is_sequence(obj):
+    return (isinstance(obj, collections.abc.Sequence)
+            and not isinstance(obj, (str, bytes)))
+
+
 def _has_items_method(obj):
     items = getattr(obj, "items", None)
     return items and callable(items)
@@ -25,6 +39,434 @@ def _has_items_method(obj):
 _none = object()
 
 
+# _local.trackers holds the sets collecting paths read through Model.select,
+# one for each active track_reads context in the current thread.
+_local = threading.local()
+
+# _lock guards the lazy construction of caches shared by all Models with the
+# same root.
+_lock = threading.RLock()
+
+# _patch_log_size is the number of patched paths remembered by each root, for
+# validating the caches of selected Models (see Model.patch).
+_patch_log_size = 1024
+
+
+def _record_read(path):
+    for tracker in getattr(_local, "trackers", ()):
+        tracker.add(path)
+
+
+def _path_str(path):
+    return "/" + "/".join(path)
+
+
+def _path_parts(path):
+    return tuple(part for part in path.split("/") if part)
+
+
+def _is_model(obj):
+    """
+    _is_model returns True if obj is a Model (i.e., an instance of one of the
+    dynamic classes created by Model).
+    """
+    return getattr(type(obj), "_initModel", None) is Model._initModel
+
+
+def _raw(model):
+    """
+    _raw returns the value a Model stands for, undoing the bool and None
+    adaptations done by Model.
+    """
+    if model.type is bool:
+        return bool(model)
+    elif model.type is type(None):
+        return None
+    return model
+
+
+def _digest(value, path, cache):
+    """
+    _digest returns the content hash of value, hashing containers bottom-up
+    from the hashes of their elements. If cache is not None, it maps paths to
+    hashes, and is both used and filled for value (at path) and every value
+    nested in it.
+    """
+    if cache is not None:
+        digest = cache.get(path)
+        if digest is not None:
+            return digest
+
+    h = hashlib.blake2b(digest_size=16)
+    if value is None:
+        h.update(b"N")
+    elif isinstance(value, bool):
+        h.update(b"T" if value else b"F")
+    elif isinstance(value, int):
+        h.update(b"I" + str(int(value)).encode())
+    elif isinstance(value, float):
+        h.update(b"D" + repr(float(value)).encode())
+    elif isinstance(value, str):
+        h.update(b"S" + value.encode("utf-8", "surrogatepass"))
+    elif isinstance(value, bytes):
+        h.update(b"B" + value)
+    elif _has_items_method(value):
+        # Items are hashed in key order, so that mappings with the same
+        # content have the same hash regardless of their insertion order.
+        h.update(b"M")
+        for item in sorted((_digest(k, None, None),
+                            _digest(v, path + (str(k),), cache))
+                           for k, v in value.items()):
+            h.update(b"".join(item))
+    elif _is_enumerable(value):
+        h.update(b"L")
+        for i, v in enumerate(value):
+            h.update(_digest(v, path + (str(i),), cache))
+    else:
+        h.update(b"O" + repr(value).encode())
+
+    digest = h.digest()
+    if cache is not None:
+        cache[path] = digest
+    return digest
+
+
+@contextlib.contextmanager
+def track_reads():
+    """
+    track_reads is a context manager that yields a set, which is filled with
+    the absolute paths of all values selected from any Model in the context
+    (when the context is left). Selecting a path with * or following a
+    reference records the iterated value or the reference itself, as well as
+    the value eventually returned. Paths that could not be found are also
+    recorded, since creating them would change the result of the selection.
+    Only selections made by the current thread are tracked.
+    """
+    reads = set()
+    tracker = set()
+    trackers = getattr(_local, "trackers", ())
+    _local.trackers = trackers + (tracker,)
+    try:
+        yield reads
+    finally:
+        _local.trackers = trackers
+        reads.update(_path_str(path) for path in tracker)
+
+
+def _find_references(value, path, refprefix, found):
+    """
+    _find_references appends (path of the container, key, reference) to found
+    for every string under value (at path) that starts with refprefix.
+    """
+    if _has_items_method(value):
+        items = value.items()
+    elif _is_enumerable(value) and not isinstance(value, (str, bytes)):
+        items = enumerate(value)
+    else:
+        return
+    for k, v in items:
+        if isinstance(v, str):
+            if v.startswith(refprefix):
+                found.append((path, value, str(k), v))
+        else:
+            _find_references(v, path + (str(k),), refprefix, found)
+
+
+def _child(value, key):
+    """
+    _child returns the element of the container value with the given key (a
+    string), raising ModelError if there is no such element.
+    """
+    try:
+        if _has_items_method(value):
+            return value[key]
+        elif _is_enumerable(value) and not isinstance(value, (str, bytes)):
+            if not key.isdigit():
+                raise ModelError("Enumerable navigation requires integers")
+            return value[int(key)]
+    except (KeyError, IndexError):
+        raise ModelError("Could not find path '{}' in '{}'".format(
+            key, value))
+    raise ModelError("Cannot lookup path '{}' in value '{}'".format(
+        key, value))
+
+
+def _lookup(value, path):
+    """
+    _lookup returns the value found at path (a tuple of keys) under value.
+    """
+    for key in path:
+        value = _child(value, key)
+    return value
+
+
+def _under(path, prefix):
+    return path[:len(prefix)] == prefix
+
+
+def _patched(root, reads, version):
+    """
+    _patched returns True if any of the paths in reads may have changed since
+    root was at version (see Model.patch). A read path ending in * (recorded
+    when * is used in the middle of a path) stands for the keys of the
+    iterated value, which only change along with the value itself or its
+    direct children.
+    """
+    patches = root._patches
+    if not patches or patches[0][0] > version + 1:
+        # Patches this old were forgotten.
+        return True
+    for patch_version, changed in reversed(patches):
+        if patch_version <= version:
+            break
+        for read in reads:
+            if read and read[-1] == "*":
+                if _under(read[:-1], changed) or changed[:-1] == read[:-1]:
+                    return True
+            elif _under(read, changed) or _under(changed, read):
+                return True
+    return False
+
+
+def _ref_prefix(path, ref, refprefix):
+    """
+    _ref_prefix returns the path of the value that resolving ref (found at
+    path) depends on: the path it points to, up to the first * or negative
+    index. References following other references may depend on any value, so
+    the root path is returned for them.
+    """
+    ref = ref[len(refprefix):]
+    if "->" in ref:
+        return ()
+    if ref.startswith("/"):
+        prefix = []
+        ref = ref[1:]
+    else:
+        prefix = list(path[:-1])
+    if ref.endswith("/"):
+        ref = ref[:-1]
+    for part in ref.split("/"):
+        if part == "*" or part.startswith("-"):
+            break
+        prefix.append(part)
+    return tuple(prefix)
+
+
+class _ReferenceIndex:
+    """
+    _ReferenceIndex indexes all references under a root Model. by_target maps
+    the path of each referenced value to the references pointing to it, as
+    (path, reference) pairs. refs holds (path, target path) pairs for all
+    references, and targets holds all target paths, both sorted.
+
+    References that could not be resolved are kept in unresolved, and those
+    whose target depends on more than their own path (because they follow
+    other references or use negative indexes) in dynamic, both mapping their
+    paths to the references. They are also indexed in waiting, which maps the
+    path of the value each of them depends on (see _ref_prefix) to their
+    paths and references, so that only the ones depending on a changed value
+    are resolved again when the root is patched (see update).
+    """
+
+    def __init__(self, root):
+        found = []
+        _find_references(_raw(root), (), root.refprefix, found)
+
+        self.refprefix = root.refprefix
+        self.by_target = {}
+        self.refs = []
+        self.unresolved = {}
+        self.dynamic = {}
+        self.waiting = {}
+        self.prefixes = None
+        for cpath, container, key, ref in found:
+            target = self._resolve(root, cpath + (key,), ref, container)
+            if target is not None:
+                self.refs.append((cpath + (key,), target))
+        self.refs.sort()
+        self.targets = sorted(self.by_target)
+        self.prefixes = sorted(self.waiting)
+        self.unresolved_paths = sorted(self.unresolved)
+
+    def _resolve(self, root, path, ref, container):
+        """
+        _resolve resolves ref (found at path, in container) and indexes it by
+        target, returning the target path (or None if it is unresolved).
+        """
+        try:
+            target = root._walk(container, path[:-1], False, ref, _none,
+                                True)[1]
+        except (ModelError, LookupError, TypeError):
+            # Broken references (or strings that only look like references)
+            # are not indexed.
+            self.unresolved[path] = ref
+            if self.prefixes is not None:
+                bisect.insort(self.unresolved_paths, path)
+            self._wait(path, ref)
+            return None
+        if "->" in ref or "/-" in ref:
+            self.dynamic[path] = ref
+            self._wait(path, ref)
+        self.by_target.setdefault(target, []).append((path, ref))
+        return target
+
+    def _wait(self, path, ref):
+        prefix = _ref_prefix(path, ref, self.refprefix)
+        refs = self.waiting.get(prefix)
+        if refs is None:
+            refs = self.waiting[prefix] = {}
+            if self.prefixes is not None:
+                bisect.insort(self.prefixes, prefix)
+        refs[path] = ref
+
+    def _unwait(self, path, ref):
+        prefix = _ref_prefix(path, ref, self.refprefix)
+        refs = self.waiting[prefix]
+        del refs[path]
+        if not refs:
+            del self.waiting[prefix]
+            del self.prefixes[bisect.bisect_left(self.prefixes, prefix)]
+
+    def _add(self, root, path, ref, container=None):
+        if container is None:
+            container = _lookup(root, path[:-1])
+        target = self._resolve(root, path, ref, container)
+        if target is None:
+            return
+        bisect.insort(self.refs, (path, target))
+        if len(self.by_target[target]) == 1:
+            bisect.insort(self.targets, target)
+
+    def _remove(self, path):
+        ref = self.unresolved.pop(path, None)
+        if ref is not None:
+            del self.unresolved_paths[
+                bisect.bisect_left(self.unresolved_paths, path)]
+            self._unwait(path, ref)
+        ref = self.dynamic.pop(path, None)
+        if ref is not None:
+            self._unwait(path, ref)
+        i = bisect.bisect_left(self.refs, (path,))
+        if i == len(self.refs) or self.refs[i][0] != path:
+            return
+        target = self.refs.pop(i)[1]
+        refs = [r for r in self.by_target[target] if r[0] != path]
+        if refs:
+            self.by_target[target] = refs
+        else:
+            del self.by_target[target]
+            del self.targets[bisect.bisect_left(self.targets, target)]
+
+    def _refs_under(self, prefix):
+        i = j = bisect.bisect_left(self.refs, (prefix,))
+        while j < len(self.refs) and _under(self.refs[j][0], prefix):
+            j += 1
+        return self.refs[i:j]
+
+    def _targets_under(self, prefix):
+        i = j = bisect.bisect_left(self.targets, prefix)
+        while j < len(self.targets) and _under(self.targets[j], prefix):
+            j += 1
+        return self.targets[i:j]
+
+    def _unresolved_under(self, prefix):
+        i = j = bisect.bisect_left(self.unresolved_paths, prefix)
+        while (j < len(self.unresolved_paths)
+               and _under(self.unresolved_paths[j], prefix)):
+            j += 1
+        return self.unresolved_paths[i:j]
+
+    def _waiting_for(self, changed):
+        """
+        _waiting_for returns the unresolved and dynamic references depending
+        on changed, a path of the value itself, one of its ancestors or one of
+        its descendants, mapping their paths to the references.
+        """
+        refs = {}
+        for i in range(len(changed)):
+            refs.update(self.waiting.get(changed[:i], ()))
+        i = bisect.bisect_left(self.prefixes, changed)
+        while i < len(self.prefixes) and _under(self.prefixes[i], changed):
+            refs.update(self.waiting[self.prefixes[i]])
+            i += 1
+        return refs
+
+    def update(self, root, changed):
+        """
+        update updates the index after the value at the path changed was
+        replaced, added or removed. Only references inside that value,
+        references pointing into it, and unresolved or dynamic references
+        depending on it are resolved again.
+        """
+        stale = {path: None for path, _ in self._refs_under(changed)}
+        stale.update(dict.fromkeys(self._unresolved_under(changed)))
+        for path in stale:
+            self._remove(path)
+
+        found = []
+        try:
+            container = _lookup(root, changed[:-1])
+            value = _child(container, changed[-1])
+        except ModelError:
+            pass
+        else:
+            if isinstance(value, str):
+                if value.startswith(root.refprefix):
+                    found.append((changed[:-1], container, changed[-1],
+                                  value))
+            else:
+                _find_references(value, changed, root.refprefix, found)
+        for cpath, container, key, ref in found:
+            self._add(root, cpath + (key,), ref, container)
+
+        retry = {}
+        for target in self._targets_under(changed):
+            retry.update(self.by_target[target])
+        retry.update(self._waiting_for(changed))
+        for path, ref in retry.items():
+            self._remove(path)
+            self._add(root, path, ref)
+
+
+def _forget(cache, path, value):
+    """
+    _forget removes the content hashes of value (at path) and every value
+    nested in it from cache.
+    """
+    cache.pop(path, None)
+    if _has_items_method(value):
+        items = value.items()
+    elif _is_enumerable(value) and not isinstance(value, (str, bytes)):
+        items = enumerate(value)
+    else:
+        return
+    for k, v in items:
+        _forget(cache, path + (str(k),), v)
+
+
+def _diff(path, value, cache, opath, ovalue, ocache, changed):
+    if _digest(value, path, cache) == _digest(ovalue, opath, ocache):
+        return
+
+    if _has_items_method(value) and _has_items_method(ovalue):
+        for key in value:
+            if key not in ovalue:
+                changed.add(path + (str(key),))
+        for key in ovalue:
+            if key not in value:
+                changed.add(path + (str(key),))
+            else:
+                _diff(path + (str(key),), value[key], cache,
+                      opath + (str(key),), ovalue[key], ocache, changed)
+    elif (_is_sequence(value) and _is_sequence(ovalue)
+          and len(value) == len(ovalue)):
+        for i in range(len(value)):
+            _diff(path + (str(i),), value[i], cache,
+                  opath + (str(i),), ovalue[i], ocache, changed)
+    else:
+        changed.add(path)
+
+
 class Model:
     """
     Model represents any named (name) Python object (value). It acts as a
@@ -33,10 +475,15 @@ class Model:
     Model.select. If the value contains the special prefix denoted by
     refprefix, that value can be used to jump to other parts of the model by
     using Model.select. Calling the model directly is equivalent to calling
-    Model.select.
+    Model.select. The path attribute holds the absolute path of the Model.
+
+    If cache_size is not None, each Model selected from this one caches up to
+    cache_size of the Models it selects (by path), so selecting the same path
+    again returns the same Model. Absolute paths are cached by the root.
     """
 
-    def __new__(cls, name, value, refprefix="#", _root=None):
+    def __new__(cls, name, value, refprefix="#", cache_size=None, _root=None,
+                _path=()):
         # Pick Model methods that should be used.
         methods = {}
         for method in cls.__dict__:
@@ -74,10 +521,20 @@ class Model:
         newcls = type(cls.__name__, (type(value),), methods)
         obj = newcls(value)
         # Initialize Model attributes.
-        obj._initModel(name, original_type, refprefix, _root)
+        obj._initModel(name, original_type, refprefix, _root, _path)
+        if _root is None:
+            obj._cache_size = cache_size
+            # Hits and misses of the caches of selected Models, and the Models
+            # owning those caches.
+            obj._cache_stats = [0, 0]
+            obj._cache_owners = {}
+            # The number of patches applied, and the paths they changed (as
+            # (version, path) pairs).
+            obj._version = 0
+            obj._patches = collections.deque(maxlen=_patch_log_size)
         return obj
 
-    def _initModel(self, name, original_type, refprefix, root):
+    def _initModel(self, name, original_type, refprefix, root, path):
         """
         Sets internal Model values
         """
@@ -88,12 +545,17 @@ class Model:
         self.root = root
         if self.root is None:
             self.root = self.value
+        self._path = path
+        self.path = _path_str(path)
+        # Models not holding the value found at path in root (e.g., results
+        # of * or default values) are detached.
+        self._detached = False
 
-    def _new(self, name, model):
+    def _new(self, name, model, path):
         """
-        _new instantiates a Model keeping the same root.
+        _new instantiates a Model at path keeping the same root.
         """
-        return Model(name, model, self.refprefix, self.root)
+        return Model(name, model, self.refprefix, _root=self.root, _path=path)
 
     def has(self, path=None):
         """
@@ -103,7 +565,7 @@ class Model:
         if path is None:
             return True
         try:
-            self._select(path)
+            self._select(path, raw=True)
         except ModelError:
             return False
 
@@ -117,9 +579,92 @@ class Model:
         if path is None:
             value = self.value
         else:
-            value = self._select(path)
+            value = self._select(path, raw=True)
         return isinstance(value, str) and value.startswith(self.refprefix)
 
+    def referrers(self, path=None, deep=False):
+        """
+        referrers returns a tuple with Models for all references pointing to
+        path (or to this Model if path is None), in document order. If deep is
+        True, references pointing to values nested in path are included too.
+        References are indexed once for the whole root.
+        """
+        target = self._path
+        if path is not None:
+            target = self._walk(self.value, self._path, self._detached,
+                                path, _none, True)[1]
+        index = self._reference_index()
+        # The result depends on every reference in the root.
+        _record_read(())
+
+        if deep:
+            refs = []
+            i = bisect.bisect_left(index.targets, target)
+            while (i < len(index.targets) and
+                   index.targets[i][:len(target)] == target):
+                refs.extend(index.by_target[index.targets[i]])
+                i += 1
+            refs.sort()
+        else:
+            refs = index.by_target.get(target, ())
+        return tuple(self._new(p[-1], ref, p) for p, ref in refs)
+
+    def dependency_order(self, path="*"):
+        """
+        dependency_order returns the Models selected by path (which must end
+        with *) ordered so that each element comes after the elements it
+        references (from anywhere within it). Elements are otherwise kept in
+        their original order, and reference cycles are broken by that order.
+        """
+        elements = self._select(path)
+        if not elements:
+            return elements
+        # The result depends on every reference in the root.
+        _record_read(())
+
+        size = len(elements[0]._path)
+        container = elements[0]._path[:-1]
+        positions = {el._path: i for i, el in enumerate(elements)}
+        deps = [[] for _ in elements]
+        refs = self._reference_index().refs
+        i = bisect.bisect_left(refs, (container,))
+        while i < len(refs) and refs[i][0][:size - 1] == container:
+            source = positions.get(refs[i][0][:size])
+            dep = positions.get(refs[i][1][:size])
+            if source is not None and dep is not None and source != dep:
+                deps[source].append(dep)
+            i += 1
+
+        order = []
+        visited = [False] * len(elements)
+        for start in range(len(elements)):
+            if visited[start]:
+                continue
+            visited[start] = True
+            stack = [(start, iter(deps[start]))]
+            while stack:
+                current, pending = stack[-1]
+                for dep in pending:
+                    if not visited[dep]:
+                        visited[dep] = True
+                        stack.append((dep, iter(deps[dep])))
+                        break
+                else:
+                    stack.pop()
+                    order.append(elements[current])
+        return tuple(order)
+
+    def _reference_index(self):
+        root = self.root
+        index = getattr(root, "_references", None)
+        if index is None:
+            with _lock:
+                index = getattr(root, "_references", None)
+                if index is None:
+                    index = _ReferenceIndex(root)
+                    root._references = index
+        return index
+
     def is_enabled(self, path=None):
         """
         if_enabled returns True if path exists and its value is True. If path
@@ -129,70 +674,375 @@ class Model:
             value = self.value
         else:
             try:
-                value = self._select(path)
+                value = self._select(path, raw=True)
             except ModelError:
                 return False
 
         return isinstance(value, int) and value != 0
 
-    def select(self, path, default=_none):
+    def fingerprint(self):
+        """
+        fingerprint returns a content hash (as a hex string) of the value of
+        this Model, including everything nested in it. Mappings with the
+        same items have the same fingerprint regardless of the order of their
+        keys. Fingerprints for the whole root are computed once and cached, so
+        they are cheap to query for any Model selected from the same root.
+        """
+        return self._fingerprint_cache()[self._path].hex()
+
+    def _fingerprint_cache(self):
+        """
+        _fingerprint_cache returns the cache mapping paths to content hashes
+        that is shared by all Models with the same root. Detached Models get
+        their own cache, since their value is not the one found at their path.
+        """
+        if self._detached:
+            cache = getattr(self, "_fingerprints", None)
+            if cache is None:
+                cache = {}
+                _digest(_raw(self), self._path, cache)
+                self._fingerprints = cache
+            return cache
+
+        root = self.root
+        cache = getattr(root, "_fingerprints", None)
+        if cache is None:
+            with _lock:
+                cache = getattr(root, "_fingerprints", None)
+                if cache is None:
+                    cache = {}
+                    _digest(_raw(root), (), cache)
+                    root._fingerprints = cache
+        if self._path not in cache:
+            # Values nested in strings (i.e., characters) are not hashed
+            # along with the root.
+            _digest(_raw(self), self._path, cache)
+        return cache
+
+    def _fingerprint_at(self, path):
+        """
+        _fingerprint_at returns the content hash of the value at the absolute
+        path in the root of this Model, or None if there is no such value.
+        A path ending in * is hashed as the value being iterated.
+        """
+        parts = _path_parts(path)
+        if parts and parts[-1] == "*":
+            parts = parts[:-1]
+        cache = self.root._fingerprint_cache()
+        digest = cache.get(parts)
+        if digest is None:
+            try:
+                value = self._walk(self.root, (), False, _path_str(parts),
+                                   _none, True)[0]
+            except (ModelError, LookupError):
+                return None
+            digest = _digest(value, parts, cache)
+        return digest
+
+    def diff(self, other):
+        """
+        diff returns the set of paths (under the path of this Model) whose
+        values differ between this Model and other. Keys added or removed from
+        a dict-like are reported by their own path, while enumerables whose
+        length changed are reported as a whole. Fingerprints are used to skip
+        unchanged values, so diff takes time proportional to the size of the
+        changes.
+        """
+        changed = set()
+        _diff(self._path, _raw(self), self._fingerprint_cache(),
+              other._path, _raw(other), other._fingerprint_cache(), changed)
+        return {_path_str(path) for path in changed}
+
+    def patch(self, ops):
+        """
+        patch applies ops, a list of JSON Patch operations (dicts with "op",
+        "path" and, except for removals, "value"), to the root of this Model,
+        changing its data in place. Supported operations are "add", "replace"
+        and "remove", and paths are JSON Pointers (absolute paths with "~1"
+        for "/" and "~0" for "~", and "-" for the end of an enumerable).
+        Operations are applied in order, so if one of them fails, the ones
+        before it stay applied.
+
+        Caches of the root (fingerprints, the reference index and the caches
+        of selected Models) are only invalidated for the paths each operation
+        changed, so patches take time proportional to the size of the
+        changes.
+
+        Only the top-level container of the root is a copy: nested
+        containers are changed in place, and they are shared with the value
+        the root was created from and with the Models selected before the
+        patch. Those Models keep the old values of their own keys, but see
+        the changes made deeper under them, so they should be selected again
+        from the root (and the original value deep-copied beforehand if it
+        must not change).
+        """
+        root = self.root
+        with _lock:
+            for op in ops:
+                root._apply(op)
+
+    def _apply(self, op):
+        """
+        _apply applies the JSON Patch operation op to this (root) Model.
+        """
+        kind = op.get("op")
+        if kind not in ("add", "replace", "remove"):
+            raise ModelError("Unsupported patch operation '{}'".format(kind))
+        pointer = op.get("path")
+        if not isinstance(pointer, str) or not pointer.startswith("/"):
+            raise ModelError("Invalid patch path '{}'".format(pointer))
+        path = tuple(part.replace("~1", "/").replace("~0", "~")
+                     for part in pointer[1:].split("/"))
+        if kind != "remove" and "value" not in op:
+            raise ModelError("Missing value for patch operation '{}' at "
+                             "'{}'".format(kind, pointer))
+        value = op.get("value")
+
+        container = _lookup(self, path[:-1])
+        key = path[-1]
+        # changed is the path whose value changes, and old is that value
+        # before the change.
+        changed = path
+        enumerable = False
+        if _has_items_method(container):
+            if key in container:
+                old = container[key]
+            elif kind == "add":
+                old = _none
+            else:
+                raise ModelError("Could not find path '{}'".format(pointer))
+        elif _is_enumerable(container) and not isinstance(container, str):
+            enumerable = True
+            size = len(container)
+            if key == "-" and kind == "add":
+                key = size
+            elif key.isdigit() and int(key) < size + (kind == "add"):
+                key = int(key)
+            else:
+                raise ModelError("Could not find path '{}'".format(pointer))
+            old = container[key] if key < size else _none
+            if kind != "replace" and key < size - (kind == "remove"):
+                # Elements after key move, which changes the whole
+                # enumerable.
+                changed = path[:-1]
+                old = list(container)
+        else:
+            raise ModelError("Cannot patch path '{}' in value '{}'".format(
+                pointer, container))
+
+        try:
+            if kind == "remove":
+                del container[key]
+            elif kind == "add" and enumerable:
+                container.insert(key, value)
+            else:
+                container[key] = value
+        except (TypeError, AttributeError):
+            raise ModelError("Cannot patch read-only value at '{}'".format(
+                _path_str(path[:-1])))
+
+        fingerprints = getattr(self, "_fingerprints", None)
+        if fingerprints is not None:
+            for i in range(len(changed)):
+                fingerprints.pop(changed[:i], None)
+            _forget(fingerprints, changed, old)
+        references = getattr(self, "_references", None)
+        if references is not None:
+            references.update(self, changed)
+        self._version += 1
+        self._patches.append((self._version, changed))
+
+    def select(self, path, default=_none, raw=False):
         """
         select returns a new Model based on path, with an optional default
-        value in case the path is valid but cannot be not found.
+        value in case the path is valid but cannot be not found. If raw is
+        True, the plain value is returned instead of a Model (and the results
+        of * are plain values as well).
         """
-        return self._select(path, default)
+        return self._select(path, default, raw)
 
     # Make model(...) a shortcut for model.select(...).
     __call__ = select
 
-    def _select(self, path, default=_none):
-        obj = self.value
+    def raw(self, path, default=_none):
+        """
+        raw is a shortcut for select(path, default, raw=True).
+        """
+        return self._select(path, default, True)
+
+    def cache_info(self):
+        """
+        cache_info returns a dict with the number of hits and misses of the
+        caches of selected Models (see cache_size) for the root of this Model,
+        and the number of Models currently cached (size).
+        """
+        root = self.root
+        hits, misses = root._cache_stats
+        owners = [ref() for ref in list(root._cache_owners.values())]
+        size = sum(len(owner._children) for owner in owners
+                   if owner is not None)
+        return {"hits": hits, "misses": misses, "size": size}
+
+    def _select(self, path, default=_none, raw=False):
+        size = self.root._cache_size
+        if size and default is _none and not raw:
+            return self._cached_select(path, size)
+        return self._select_new(path, default, raw)
+
+    def _cached_select(self, path, size):
+        owner = self
+        if path.startswith("/") or path.startswith(self.refprefix + "/"):
+            owner = self.root
+        cache = getattr(owner, "_children", None)
+        if cache is None:
+            owners = self.root._cache_owners
+            key = id(owner)
+            try:
+                owners[key] = weakref.ref(owner,
+                                          lambda _: owners.pop(key, None))
+            except TypeError:
+                # Some Models (e.g., tuples from *) cannot be weakly
+                # referenced, and don't cache.
+                return self._select_new(path, _none, False)
+            cache = owner._children = {}
+        stats = self.root._cache_stats
+
+        entry = cache.get(path)
+        if entry is not None:
+            result, reads, version = entry
+            root = self.root
+            if version != root._version:
+                if _patched(root, reads, version):
+                    entry = None
+                else:
+                    cache[path] = (result, reads, root._version)
+        if entry is not None:
+            stats[0] += 1
+            for read in reads:
+                _record_read(read)
+            return result
+
+        stats[1] += 1
+        # Keep the paths read while selecting, so they can be replayed on
+        # hits.
+        reads = set()
+        trackers = getattr(_local, "trackers", ())
+        _local.trackers = trackers + (reads,)
+        try:
+            result = self._select_new(path, _none, False)
+        finally:
+            _local.trackers = trackers
+
+        cache[path] = (result, tuple(reads), self.root._version)
+        if len(cache) > size:
+            # Evict the oldest entry.
+            try:
+                del cache[next(iter(cache))]
+            except (KeyError, RuntimeError, StopIteration):
+                pass
+        return result
+
+    def _select_new(self, path, default, raw):
+        obj, parts, name, detached = self._walk(
+            self.value, self._path, self._detached, path, default, raw)
+        _record_read(parts)
+        if raw:
+            return obj
+        result = self._new(name, obj, parts)
+        result._detached = detached
+        return result
+
+    def _walk(self, obj, base, detached, path, default, raw):
+        """
+        _walk navigates path starting from obj (found at path base), and
+        returns the value found, its path, its name and whether it is
+        detached. Models are only created for the results of *, unless raw
+        is True.
+        """
         name = None
         curpath = []
+        parts = list(base)
 
         # Ignore ref indicators and navigate accordingly.
         if path.startswith(self.refprefix):
             path = path[1:]
             if path.endswith("->"):
                 path = path[:-2]
-                return self._select(path, default)
+                return self._walk(obj, base, detached, path, default, raw)
         # When an absolute path is used in a query, revert to the root.
         if path.startswith("/"):
             path = path[1:]
             obj = self.root
             curpath.append("")
+            parts = []
+            detached = False
         # Empty path trailings are ignored.
         if path.endswith("/"):
             path = path[:-1]
 
-        parts = path.split("/")
-        for i in range(len(parts)):
-            part = parts[i]
+        pathparts = path.split("/")
+        for i in range(len(pathparts)):
+            part = pathparts[i]
             curpath.append(part)
-            if part == "*" and i == len(parts) - 1:
+            if part == "*":
+                # Items are only iterated once, so that views over stored
+                # values (see fstringen.sqlite) can read them page by page.
                 if _has_items_method(obj):
-                    elements = tuple(self._new(k, v) for k, v in obj.items())
+                    items = obj.items()
+                    container = tuple
                 elif _is_enumerable(obj):
-                    elements = type(obj)(
-                        self._new(str(i), v) for i, v in enumerate(obj)
-                    )
+                    items = ((str(i), v) for i, v in enumerate(obj))
+                    container = tuple
+                    if isinstance(obj, (list, tuple)):
+                        container = type(obj)
                 else:
+                    _record_read(tuple(parts))
                     raise ModelError(
                         "Cannot iterate over '{}'".format("/".join(curpath[:-1]))
                     )
-                obj = elements
-                name = "*"
+
+                parts = tuple(parts)
+                if i == len(pathparts) - 1:
+                    if raw:
+                        obj = container(v for _, v in items)
+                    else:
+                        obj = container(self._new(k, v, parts + (str(k),))
+                                        for k, v in items)
+                    return obj, parts, "*", True
+
+                # With * in the middle of the path, the rest of the path is
+                # selected from each element, and the result only depends on
+                # the keys of the iterated value (besides the selected ones).
+                rest = "/".join(pathparts[i + 1:])
+                nested = "*" in pathparts[i + 1:]
+                results = []
+                for k, v in items:
+                    r = self._walk(v, parts + (str(k),), detached, rest,
+                                   default, raw)
+                    _record_read(r[1])
+                    if nested:
+                        results.extend(r[0])
+                    elif raw:
+                        results.append(r[0])
+                    else:
+                        model = self._new(r[2], r[0], r[1])
+                        model._detached = r[3]
+                        results.append(model)
+                return container(results), parts + ("*",), "*", True
             elif part.endswith("->"):
                 part = part[:-2]
+                _record_read(tuple(parts) + (part,))
                 newpath = obj[part]
-                newmodel = self._new(part, obj)
-                obj = newmodel._select(newpath, default)
-                name = obj.name
+                obj, parts, name, detached = self._walk(
+                    obj, tuple(parts), detached, newpath, default, raw)
+                parts = list(parts)
             else:
+                key = part
                 try:
                     obj = obj[part]
                 except TypeError:
                     if not _is_enumerable(obj):
+                        _record_read(tuple(parts))
                         raise ModelError(
                             "Cannot lookup path '{}' in value '{}'".format(
                                 part, str(obj)
@@ -201,30 +1051,45 @@ class Model:
                     try:
                         part = int(part)
                     except ValueError:
+                        _record_read(tuple(parts))
                         raise ModelError("Enumerable navigation requires integers")
                     try:
+                        index = part if part >= 0 else part + len(obj)
                         obj = obj[part]
                     except IndexError:
+                        parts.append(str(part))
                         if default is not _none:
                             obj = default
+                            detached = True
                             break
+                        _record_read(tuple(parts))
                         raise ModelError(
                             "Could not find path '{}' in '{}'".format(
                                 "/".join(curpath), obj
                             )
                         )
+                    key = str(index)
                 except KeyError:
+                    parts.append(part)
                     if default is not _none:
                         obj = default
+                        detached = True
                         break
+                    _record_read(tuple(parts))
                     raise ModelError(
                         "Could not find path '{}' in '{}'".format(
                             "/".join(curpath), obj
                         )
                     )
+                # Elements selected with * are Models with their own paths.
+                if _is_model(obj):
+                    parts = list(obj._path)
+                    detached = obj._detached
+                else:
+                    parts.append(key)
                 name = part
 
-        return self._new(name, obj)
+        return obj, tuple(parts), name, detached
 
 
-__all__ = "Model", "ModelError"
+__all__ = "Model", "ModelError", "track_reads"
@@ -1,6 +1,9 @@
+import copy
+import gc
 import unittest
+import weakref
 
-from .model import Model, ModelError
+from .model import Model, ModelError, track_reads
 
 
 test_model = {
@@ -110,6 +113,67 @@ class TestModel(unittest.TestCase):
             m.select("/components/*").select("1"),
             test_model["components"]["componentB"])
 
+    def test_select_star_middle(self):
+        m = Model("test", test_model, refprefix="$")
+        names = m.select("/components/*/properties/name")
+        self.assertEqual(names, ("componentA", "componentB"))
+        self.assertEqual(names.name, "*")
+        self.assertEqual(names.path, "/components/*")
+        self.assertEqual([n.path for n in names],
+                         ["/components/componentA/properties/name",
+                          "/components/componentB/properties/name"])
+        self.assertEqual(m.select("/animals/*/type"), ["whale", "lion"])
+        self.assertEqual(m.select("/animals/*/other->/type"),
+                         ["lion", "whale"])
+        self.assertEqual(m.select("/components").select("*/properties/age"),
+                         (3, 9))
+
+        # Nested * flatten the results.
+        self.assertEqual(
+            m.select("/components/*/properties/nicknames/*"),
+            ("cA", "compA", "A", "cB", "compB", "B"))
+
+        # Defaults apply to each element.
+        self.assertEqual(m.select("/components/*/properties/parent", None),
+                         (None, "$/components/componentA"))
+        self.assertRaisesRegex(
+            ModelError,
+            "Could not find path 'properties/parent' in .*",
+            m.select, "/components/*/properties/parent")
+
+        with track_reads() as reads:
+            m.select("/components/*/properties/name")
+        self.assertEqual(reads, {
+            "/components/*",
+            "/components/componentA/properties/name",
+            "/components/componentB/properties/name",
+        })
+
+    def test_select_raw(self):
+        m = Model("test", test_model, refprefix="$")
+        dead = m.select("/components/componentA/properties/dead", raw=True)
+        self.assertIs(dead, False)
+        self.assertIs(m.raw("/components/componentA/properties/nothing"),
+                      None)
+        self.assertIs(m.raw("/components/componentA"),
+                      test_model["components"]["componentA"])
+        self.assertIs(m.raw("/components/componentB/properties/parent->"),
+                      test_model["components"]["componentA"])
+        self.assertEqual(m.raw("/components/*/properties/color"),
+                         ("blue", "red"))
+        self.assertEqual(type(m.raw("/week/*")), list)
+        self.assertEqual(m.raw("/animals/*/type"), ["whale", "lion"])
+        self.assertEqual(m.raw("/components/componentZ", 1), 1)
+        self.assertEqual(type(m.raw("/components/componentZ", 1)), int)
+
+        with track_reads() as reads:
+            m.raw("/week/1")
+        self.assertEqual(reads, {"/week/1"})
+
+        # Methods of the underlying type are not shadowed.
+        self.assertEqual(list(m.select("/components/componentA").values()),
+                         list(test_model["components"]["componentA"].values()))
+
     def test_select_relative(self):
         m = Model("test", test_model)
         components = m.select("/components")
@@ -217,3 +281,324 @@ class TestModel(unittest.TestCase):
         self.assertRaisesRegex(ModelError, "Could not find path .*",
                                m, "attr")
         self.assertEqual(m("attr", "default value"), "default value")
+
+    def test_path(self):
+        m = Model("test", test_model, refprefix="$")
+        self.assertEqual(m.path, "/")
+        self.assertEqual(m.select("/components/componentA").path,
+                         "/components/componentA")
+        self.assertEqual(
+            m.select("/components").select("componentA/properties").path,
+            "/components/componentA/properties")
+        self.assertEqual(m.select("/components/*").path, "/components")
+        self.assertEqual([el.path for el in m.select("/week/*")][:2],
+                         ["/week/0", "/week/1"])
+        self.assertEqual(m.select("/components/*").select("1").path,
+                         "/components/componentB")
+        self.assertEqual(m.select("/week/-1").path, "/week/4")
+        self.assertEqual(m.select("/week/-1").name, -1)
+        self.assertEqual(
+            m.select("/components/componentB/properties/parent->").path,
+            "/components/componentA")
+        self.assertEqual(
+            m.select("/components/componentB/favoriteprop->").path,
+            "/components/componentB/properties/color")
+        self.assertEqual(m.select("/components/componentZ", None).path,
+                         "/components/componentZ")
+
+    def test_track_reads(self):
+        m = Model("test", test_model, refprefix="$")
+        with track_reads() as reads:
+            m.select("/components/*")
+            m.select("/week/1")
+            m.select("/components/componentB/favoriteprop->")
+            m.has("/components/componentZ/properties")
+            self.assertEqual(reads, set())
+
+        self.assertEqual(reads, {
+            "/components",
+            "/week/1",
+            "/components/componentB/favoriteprop",
+            "/components/componentB/properties/color",
+            "/components/componentZ",
+        })
+
+        # Nested contexts all see the reads.
+        with track_reads() as outer:
+            with track_reads() as inner:
+                m.select("/week")
+        self.assertEqual(outer, {"/week"})
+        self.assertEqual(inner, {"/week"})
+
+    def test_fingerprint(self):
+        m = Model("test", test_model)
+        other = Model("other", copy.deepcopy(test_model))
+        self.assertEqual(m.fingerprint(), other.fingerprint())
+        self.assertEqual(len(m.fingerprint()), 32)
+        self.assertEqual(m.select("/components/componentA").fingerprint(),
+                         other.select("/components/componentA").fingerprint())
+        self.assertNotEqual(
+            m.select("/components/componentA").fingerprint(),
+            m.select("/components/componentB").fingerprint())
+        # Types are part of the fingerprint.
+        self.assertNotEqual(
+            Model("test", {"a": 1}).fingerprint(),
+            Model("test", {"a": True}).fingerprint())
+        self.assertNotEqual(
+            Model("test", {"a": None}).fingerprint(),
+            Model("test", {"a": ""}).fingerprint())
+        # The order of keys in mappings is not part of the fingerprint.
+        self.assertEqual(
+            Model("test", {"a": 1, "b": {"c": 2, "d": 3}}).fingerprint(),
+            Model("test", {"b": {"d": 3, "c": 2}, "a": 1}).fingerprint())
+        self.assertNotEqual(
+            Model("test", {"a": 1, "b": 2}).fingerprint(),
+            Model("test", {"a": 2, "b": 1}).fingerprint())
+        # Fingerprints are cached in the root.
+        self.assertIn(("components", "componentA", "properties", "age"),
+                      m._fingerprints)
+
+        # Detached Models are fingerprinted by their own value.
+        self.assertEqual(m.select("/week/*").fingerprint(),
+                         m.select("/week").fingerprint())
+        self.assertEqual(
+            m.select("/components/componentZ", [1, 2]).fingerprint(),
+            Model("test", [1, 2]).fingerprint())
+        self.assertNotIn(("components", "componentZ"), m._fingerprints)
+        self.assertEqual(m.select("/animals/0/type/0").fingerprint(),
+                         Model("test", "w").fingerprint())
+
+    def test_diff(self):
+        new_model = copy.deepcopy(test_model)
+        new_model["components"]["componentA"]["properties"]["age"] = 4
+        new_model["components"]["componentA"]["properties"]["dead"] = 0
+        del new_model["components"]["componentB"]["favoriteprop"]
+        new_model["week"].append("sat")
+        new_model["animals"][1]["type"] = "tiger"
+
+        old = Model("test", test_model)
+        new = Model("test", new_model)
+        self.assertEqual(old.diff(old), set())
+        self.assertEqual(old.diff(new), {
+            "/components/componentA/properties/age",
+            "/components/componentA/properties/dead",
+            "/components/componentB/favoriteprop",
+            "/week",
+            "/animals/1/type",
+        })
+        self.assertEqual(
+            old.select("/animals").diff(new.select("/animals")),
+            {"/animals/1/type"})
+
+    def test_referrers(self):
+        m = Model("test", test_model, refprefix="$")
+        compA = m.select("/components/componentA")
+        self.assertEqual(compA.referrers(), ("$/components/componentA",))
+        self.assertEqual([r.path for r in compA.referrers()],
+                         ["/components/componentB/properties/parent"])
+        self.assertEqual([r.name for r in compA.referrers()], ["parent"])
+        self.assertEqual(m.referrers("/components/componentB"), ())
+        self.assertEqual(
+            [r.path for r in m.referrers("/components/componentB",
+                                         deep=True)],
+            ["/components/componentB/favoriteprop"])
+        self.assertEqual([r.path for r in m.referrers("/animals", deep=True)],
+                         ["/animals/0/other", "/animals/1/other"])
+        # Paths are resolved before looking them up.
+        self.assertEqual(
+            m.referrers("/components/componentB/properties/parent->"),
+            compA.referrers())
+        # Default reference prefixes don't match anything in test_model.
+        self.assertEqual(Model("test", test_model).referrers("/animals/0"),
+                         ())
+
+        with track_reads() as reads:
+            compA.referrers()
+        self.assertEqual(reads, {"/"})
+
+    def test_dependency_order(self):
+        m = Model("test", {
+            "schemas": {
+                "a": {"items": "#/schemas/c"},
+                "b": {"fields": ["#/schemas/a/items", "#/schemas/d"]},
+                "c": {"type": "string"},
+                "d": {"next": "#/schemas/e", "self": "#/schemas/d"},
+                "e": {"prev": "#/schemas/d"},
+            },
+            "root": "#/schemas/b",
+        })
+        self.assertEqual(
+            [el.name for el in m.dependency_order("/schemas/*")],
+            ["c", "a", "e", "d", "b"])
+        self.assertEqual(
+            [el.name for el in m.select("/schemas").dependency_order()],
+            ["c", "a", "e", "d", "b"])
+        self.assertEqual(m.dependency_order("/schemas/c/*"), ("string",))
+
+    def test_patch(self):
+        data = copy.deepcopy(test_model)
+        m = Model("test", data, refprefix="$", cache_size=8)
+        m.fingerprint()
+        compA = m.select("/components/componentA")
+        self.assertEqual(len(compA.referrers()), 1)
+        components = m.select("/components")
+        week = m.select("/week")
+
+        def check():
+            expected = Model("test", copy.deepcopy(data), refprefix="$")
+            self.assertEqual(m, expected)
+            self.assertEqual(m.fingerprint(), expected.fingerprint())
+            self.assertEqual(
+                m.select("/animals").fingerprint(),
+                expected.select("/animals").fingerprint())
+            index = m._reference_index()
+            expected_index = expected._reference_index()
+            self.assertEqual(index.refs, expected_index.refs)
+            self.assertEqual(index.targets, expected_index.targets)
+            self.assertEqual(index.unresolved, expected_index.unresolved)
+            self.assertEqual(index.unresolved_paths,
+                             expected_index.unresolved_paths)
+            self.assertEqual(index.waiting, expected_index.waiting)
+            self.assertEqual(index.prefixes, expected_index.prefixes)
+            self.assertEqual(
+                {k: sorted(v) for k, v in index.by_target.items()},
+                {k: sorted(v) for k, v in expected_index.by_target.items()})
+
+        m.patch([
+            {"op": "replace",
+             "path": "/components/componentA/properties/color",
+             "value": "green"},
+            {"op": "add", "path": "/components/componentA/properties/size",
+             "value": 3},
+            {"op": "remove", "path": "/components/componentB/favoriteprop"},
+        ])
+        self.assertEqual(m.select("/components/componentA/properties/color"),
+                         "green")
+        self.assertFalse(m.has("/components/componentB/favoriteprop"))
+        check()
+
+        # Only cached Models that read the patched paths are selected again.
+        self.assertIs(m.select("/week"), week)
+        self.assertIsNot(m.select("/components"), components)
+        m.patch([{"op": "add", "path": "/week/-", "value": "sat"}])
+        self.assertEqual(m.select("/week")[-1], "sat")
+        check()
+
+        # References are updated as they (or their targets) change.
+        m.patch([
+            {"op": "replace", "path": "/components/componentB/properties/"
+             "parent", "value": "$/animals/1"},
+            {"op": "add", "path": "/animals/0", "value": {"other": "$/week"}},
+            {"op": "add", "path": "/components/componentA/properties/"
+             "parent", "value": "$/components/componentC"},
+        ])
+        self.assertEqual(m.select("/animals/0/other->"), m.select("/week"))
+        self.assertEqual(
+            m.select("/components/componentB/properties/parent->/type"),
+            "whale")
+        check()
+        m.patch([
+            {"op": "add", "path": "/components/componentC", "value": {}},
+            {"op": "remove", "path": "/animals/1"},
+            {"op": "replace", "path": "/components/componentA/properties/"
+             "nicknames/1", "value": "a~/b"},
+        ])
+        self.assertEqual(len(m.referrers("/components/componentC")), 1)
+        check()
+        # Unresolved references are only resolved again when a value they
+        # depend on changes.
+        index = m._reference_index()
+        self.assertEqual(index._waiting_for(("week", "0")), {})
+        self.assertEqual(
+            index._waiting_for(("components", "componentX", "name")),
+            {("components", "componentA", "properties", "brokenref"):
+             "$/components/componentX"})
+
+        # Selections with * in the middle of the path depend on the keys of
+        # the iterated value.
+        other = Model("test", copy.deepcopy(test_model), cache_size=16)
+        colors = other.select("/components/*/properties/color")
+        self.assertEqual(colors, ("blue", "red"))
+        other.patch([{"op": "replace", "path": "/week/0", "value": "sun"}])
+        self.assertIs(other.select("/components/*/properties/color"), colors)
+        other.patch([{"op": "add", "path": "/components/componentC",
+                      "value": {"properties": {"color": "green"}}}])
+        self.assertEqual(other.select("/components/*/properties/color"),
+                         ("blue", "red", "green"))
+        other.patch([{"op": "remove", "path": "/components/componentA"}])
+        self.assertEqual(other.select("/components/*/properties/color"),
+                         ("red", "green"))
+
+        # Keys with "/" and "~" are escaped.
+        m.patch([{"op": "add", "path": "/a~1b~0c", "value": 1}])
+        self.assertEqual(m["a/b~c"], 1)
+
+        for op in ({"op": "move", "path": "/week"},
+                   {"op": "add", "path": "week", "value": 1},
+                   {"op": "add", "path": "/week/1"},
+                   {"op": "replace", "path": "/components/componentZ",
+                    "value": 1},
+                   {"op": "remove", "path": "/week/10"},
+                   {"op": "add", "path": "/week/name", "value": 1},
+                   {"op": "add", "path": "/week/0/x", "value": 1}):
+            with self.assertRaises(ModelError):
+                m.patch([op])
+
+    def test_patch_sharing(self):
+        data = {"a": {"b": {"c": 1}, "x": 1}, "t": 1}
+        m = Model("test", data)
+        a = m.select("/a")
+        m.patch([
+            {"op": "replace", "path": "/t", "value": 2},
+            {"op": "replace", "path": "/a/x", "value": 2},
+            {"op": "replace", "path": "/a/b/c", "value": 2},
+        ])
+        self.assertEqual(m, {"a": {"b": {"c": 2}, "x": 2}, "t": 2})
+        # Nested containers are shared with the original value and with
+        # previously selected Models.
+        self.assertEqual(data, {"a": {"b": {"c": 2}, "x": 2}, "t": 1})
+        self.assertEqual(a, {"b": {"c": 2}, "x": 1})
+        self.assertEqual(m.select("/a"), {"b": {"c": 2}, "x": 2})
+
+    def test_cache(self):
+        m = Model("test", test_model, refprefix="$", cache_size=2)
+        components = m.select("/components")
+        self.assertIs(m.select("/components"), components)
+        compA = components.select("componentA")
+        self.assertIs(components.select("componentA"), compA)
+        self.assertIs(compA("properties/color"), compA("properties/color"))
+        self.assertEqual(m.cache_info(), {"hits": 3, "misses": 3, "size": 3})
+
+        # Defaults and raw selections are not cached.
+        self.assertIsNot(components.select("componentZ", None),
+                         components.select("componentZ", None))
+        self.assertEqual(m.cache_info()["misses"], 3)
+
+        # Caches are bounded.
+        components.select("componentB")
+        components.select("componentB/properties")
+        self.assertIsNot(components.select("componentA"), compA)
+
+        # Reads are replayed on hits.
+        parent = "componentB/properties/parent->"
+        components.select(parent)
+        with track_reads() as reads:
+            components.select(parent)
+        self.assertEqual(reads, {"/components/componentB/properties/parent",
+                                 "/components/componentA"})
+
+        # Caches are released with their Models (selecting with a default
+        # bypasses the cache of the root).
+        size = m.cache_info()["size"]
+        components = m.select("/components", None)
+        ref = weakref.ref(components.select("componentA"))
+        self.assertEqual(m.cache_info()["size"], size + 1)
+        del components
+        gc.collect()
+        self.assertIsNone(ref())
+        self.assertEqual(m.cache_info()["size"], size)
+
+        # Uncached Models always create new Models.
+        m = Model("test", test_model)
+        self.assertIsNot(m.select("/components"), m.select("/components"))
+        self.assertEqual(m.cache_info(), {"hits": 0, "misses": 0, "size": 0})
@@ -0,0 +1,55 @@
+import re
+
+
+def line_endings(newline="\n", final=True):
+    """
+    line_endings returns a post-processing stage that converts all line
+    endings to newline. If final is True, it also makes sure non-empty files
+    end with newline.
+    """
+    def line_endings(fname, text):
+        text = re.sub(r"\r\n|\r|\n", lambda _: newline, text)
+        if final and text and not text.endswith(newline):
+            text += newline
+        return text
+
+    return line_endings
+
+
+def license_header(header, check=False):
+    """
+    license_header returns a post-processing stage that adds header to the
+    start of files not starting with it already. If check is True, files
+    missing header are reported as errors instead.
+    """
+    def license_header(fname, text):
+        if text.startswith(header):
+            return text
+        if check:
+            raise ValueError("Missing license header")
+        return header + text
+
+    return license_header
+
+
+def black(suffixes=(".py", ".pyi"), **mode):
+    """
+    black returns a post-processing stage that reformats Python files (those
+    with names ending in one of suffixes) with black, which must be
+    installed. Other keyword arguments are passed to black.Mode.
+    """
+    try:
+        import black as _black
+    except ImportError:
+        raise ImportError("black is required to reformat Python files")
+    mode = _black.Mode(**mode)
+
+    def black(fname, text):
+        if not fname.endswith(tuple(suffixes)):
+            return text
+        return _black.format_str(text, mode=mode)
+
+    return black
+
+
+__all__ = "line_endings", "license_header", "black"
@@ -0,0 +1,39 @@
+import unittest
+
+from .postprocess import black, license_header, line_endings
+
+try:
+    import black as _black
+except ImportError:
+    _black = None
+
+
+class TestPostprocess(unittest.TestCase):
+    def test_line_endings(self):
+        stage = line_endings()
+        self.assertEqual(stage("a.txt", "a\r\nb\rc"), "a\nb\nc\n")
+        self.assertEqual(stage("a.txt", ""), "")
+        stage = line_endings("\r\n", final=False)
+        self.assertEqual(stage("a.txt", "a\nb\r\n"), "a\r\nb\r\n")
+        self.assertEqual(stage("a.txt", "a\nb"), "a\r\nb")
+
+    def test_license_header(self):
+        stage = license_header("// MIT\n")
+        self.assertEqual(stage("a.go", "package a\n"), "// MIT\npackage a\n")
+        self.assertEqual(stage("a.go", "// MIT\npackage a\n"),
+                         "// MIT\npackage a\n")
+
+        stage = license_header("// MIT\n", check=True)
+        self.assertEqual(stage("a.go", "// MIT\n"), "// MIT\n")
+        with self.assertRaises(ValueError):
+            stage("a.go", "package a\n")
+
+    @unittest.skipIf(_black is None, "black is not installed")
+    def test_black(self):
+        stage = black()
+        self.assertEqual(stage("a.py", "x = [1,2]"), "x = [1, 2]\n")
+        self.assertEqual(stage("a.txt", "x = [1,2]"), "x = [1,2]")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,237 @@
+import json
+import os
+import socket
+import socketserver
+import threading
+import time
+import traceback
+
+from . import generator
+from .batch import load_model, load_module
+from .sink import DirectorySink
+
+# The protocol is line-based: clients send requests as JSON objects, one per
+# line, and the server answers each of them with a JSON object on a line.
+#
+# Generation requests hold the path of the generator module ("module"), and
+# optionally the path of a model file ("model") to pass to the file
+# generators instead of the models given to gen, the reference prefix for
+# that model ("refprefix"), the directory to write files to ("outdir",
+# defaulting to the current directory of the server) and the files to
+# generate ("targets", defaulting to all files). Responses hold "ok", and
+# either the generated "files" or the "error". They also include the time
+# spent serving the request ("timings", in seconds, for loading the module
+# and the model, rendering, and in total) and whether the module and the
+# model were already loaded ("cached").
+#
+# Requests with "command" set to "stats" return the aggregate timings of all
+# generation requests served so far, and "shutdown" stops the server.
+
+_phases = ("module", "model", "render", "total")
+
+
+class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Server is a generation server listening on the Unix socket at path. It
+    keeps generator modules and models loaded between requests, and only
+    loads them again once their files change (by modification time).
+    Requests are served concurrently, each in its own thread.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, path):
+        self.path = path
+        self.requests = 0
+        self.errors = 0
+        self.timings = {phase: [0.0, 0.0] for phase in _phases}  # total, max
+        self._modules = {}
+        self._models = {}
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        if os.path.exists(path):
+            # Remove the socket of a server that is gone, but never steal
+            # the socket of a running one.
+            try:
+                with socket.socket(socket.AF_UNIX) as s:
+                    s.connect(path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                os.unlink(path)
+            else:
+                raise OSError("A server is already listening on '{}'"
+                              .format(path))
+        super().__init__(path, _Handler)
+
+    def server_close(self):
+        super().server_close()
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+    def module(self, fname):
+        """
+        module returns the generator module at fname along with its file
+        generators (see load_module), and whether it was already loaded.
+        """
+        fname = os.path.abspath(fname)
+        mtime = os.stat(fname).st_mtime_ns
+        with self._load_lock:
+            entry = self._modules.get(fname)
+            if entry is not None and entry[0] == mtime:
+                return entry[1], entry[2], True
+            module = load_module(fname)
+            output = module._fstringen_output
+            self._modules[fname] = mtime, module, output
+        return module, output, False
+
+    def model(self, fname, refprefix="#"):
+        """
+        model returns the model loaded from the file at fname (see
+        load_model), and whether it was already loaded.
+        """
+        fname = os.path.abspath(fname)
+        mtime = os.stat(fname).st_mtime_ns
+        key = fname, refprefix
+        with self._load_lock:
+            entry = self._models.get(key)
+            if entry is not None and entry[0] == mtime:
+                return entry[1], True
+        model = load_model(fname, refprefix=refprefix)
+        with self._load_lock:
+            self._models[key] = mtime, model
+        return model, False
+
+    def _serve(self, request):
+        """
+        _serve serves a single request (a dict), returning the response.
+        """
+        command = request.get("command", "generate")
+        if command == "stats":
+            return {"ok": True, "stats": self.stats()}
+        elif command == "shutdown":
+            # shutdown waits for serve_forever to return, so it cannot be
+            # called from the thread serving this request.
+            threading.Thread(target=self.shutdown).start()
+            return {"ok": True}
+        elif command != "generate":
+            return {"ok": False,
+                    "error": "Unknown command '{}'".format(command)}
+
+        timings = dict.fromkeys(_phases, 0.0)
+        cached = {}
+        start = time.perf_counter()
+        try:
+            phase = time.perf_counter()
+            _, output, cached["module"] = self.module(request["module"])
+            timings["module"] = time.perf_counter() - phase
+
+            model = None
+            if request.get("model"):
+                phase = time.perf_counter()
+                model, cached["model"] = self.model(
+                    request["model"], request.get("refprefix", "#"))
+                timings["model"] = time.perf_counter() - phase
+
+            phase = time.perf_counter()
+            sink = DirectorySink(request.get("outdir") or ".")
+            readsets = generator._generate(
+                output, sink, request.get("targets"), model, None, None,
+                None)
+            timings["render"] = time.perf_counter() - phase
+            response = {"ok": True, "files": sorted(readsets)}
+        except Exception as e:
+            if isinstance(e, generator.FStringenError):
+                error = str(e).strip()
+            else:
+                error = traceback.format_exc()
+            response = {"ok": False, "error": error}
+        timings["total"] = time.perf_counter() - start
+        response["timings"] = timings
+        response["cached"] = cached
+        self._record(timings, response["ok"])
+        return response
+
+    def _record(self, timings, ok):
+        with self._lock:
+            self.requests += 1
+            if not ok:
+                self.errors += 1
+            for phase, elapsed in timings.items():
+                stat = self.timings[phase]
+                stat[0] += elapsed
+                stat[1] = max(stat[1], elapsed)
+
+    def stats(self):
+        """
+        stats returns the number of generation requests served, how many of
+        them failed, and the total, mean and maximum time spent in each phase
+        of those requests.
+        """
+        with self._lock:
+            count = self.requests
+            return {
+                "requests": count,
+                "errors": self.errors,
+                "timings": {
+                    phase: {"total": total, "mean": total / count if count
+                            else 0.0, "max": maximum}
+                    for phase, (total, maximum) in self.timings.items()
+                },
+            }
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+                if not isinstance(request, dict):
+                    raise ValueError("requests must be JSON objects")
+            except ValueError as e:
+                response = {"ok": False,
+                            "error": "Invalid request: {}".format(e)}
+            else:
+                response = self.server._serve(request)
+            self.wfile.write(json.dumps(response).encode() + b"\n")
+            self.wfile.flush()
+
+
+def serve(path):
+    """
+    serve runs a generation server on the Unix socket at path (see Server)
+    until it is shut down or interrupted.
+    """
+    with Server(path) as server:
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+def request(path, data):
+    """
+    request sends data (a request dict) to the generation server listening
+    on the Unix socket at path, and returns its response. Relative paths in
+    generation requests are made absolute first, since the server may run in
+    another directory.
+    """
+    data = dict(data)
+    for key in ("module", "model", "outdir"):
+        if data.get(key):
+            data[key] = os.path.abspath(data[key])
+    if data.get("command", "generate") == "generate":
+        data.setdefault("outdir", os.getcwd())
+
+    with socket.socket(socket.AF_UNIX) as s:
+        s.connect(path)
+        with s.makefile("rwb") as f:
+            f.write(json.dumps(data).encode() + b"\n")
+            f.flush()
+            line = f.readline()
+    if not line:
+        raise ConnectionError("The server closed the connection")
+    return json.loads(line)
+
+
+__all__ = "Server", "serve", "request"
@@ -0,0 +1,156 @@
+import contextlib
+import io
+import json
+import os
+import socket
+import tempfile
+import threading
+import unittest
+
+from .__main__ import main
+from .batch_test import GENERATOR
+from .generator_test import IsolatedOutput
+
+if hasattr(socket, "AF_UNIX"):
+    from .server import Server, request
+
+
+@unittest.skipUnless(hasattr(socket, "AF_UNIX"), "Unix sockets unavailable")
+class TestServer(IsolatedOutput, unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = self.tmpdir.name
+        self.module = os.path.join(self.path, "structs_gen.py")
+        with open(self.module, "w") as f:
+            f.write(GENERATOR)
+        self.model = os.path.join(self.path, "spec.json")
+        with open(self.model, "w") as f:
+            json.dump({"structs": {"s0": {"id": "int"}}}, f)
+        self.outdir = os.path.join(self.path, "out")
+
+        self.socket = os.path.join(self.path, "fstringen.sock")
+        self.server = Server(self.socket)
+        self.thread = threading.Thread(target=self.server.serve_forever,
+                                       kwargs={"poll_interval": 0.05})
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.thread.join()
+        self.server.server_close()
+        self.tmpdir.cleanup()
+        super().tearDown()
+
+    def generate(self, **kwargs):
+        data = {"module": self.module, "model": self.model,
+                "outdir": self.outdir}
+        data.update(kwargs)
+        return request(self.socket, data)
+
+    def read(self, fname):
+        with open(os.path.join(self.outdir, fname)) as f:
+            return f.read()
+
+    def test_generate(self):
+        response = self.generate()
+        self.assertTrue(response["ok"], response.get("error"))
+        self.assertEqual(response["files"], ["count.txt", "structs.go"])
+        self.assertEqual(response["cached"], {"module": False, "model": False})
+        self.assertEqual(self.read("count.txt"), "1")
+        self.assertEqual(set(response["timings"]),
+                         {"module", "model", "render", "total"})
+
+        # Modules and models are only loaded again once they change.
+        response = self.generate(targets=["count.txt"])
+        self.assertEqual(response["files"], ["count.txt"])
+        self.assertEqual(response["cached"], {"module": True, "model": True})
+
+        with open(self.model, "w") as f:
+            json.dump({"structs": {"s0": {}, "s1": {}}}, f)
+        stat = os.stat(self.model)
+        os.utime(self.model, ns=(stat.st_atime_ns,
+                                 stat.st_mtime_ns + 10 ** 9))
+        with open(self.module, "a") as f:
+            f.write("\nmodel = None\n")
+        stat = os.stat(self.module)
+        os.utime(self.module, ns=(stat.st_atime_ns,
+                                  stat.st_mtime_ns + 10 ** 9))
+        response = self.generate()
+        self.assertEqual(response["cached"], {"module": False, "model": False})
+        self.assertEqual(self.read("count.txt"), "2")
+
+        stats = request(self.socket, {"command": "stats"})["stats"]
+        self.assertEqual(stats["requests"], 3)
+        self.assertEqual(stats["errors"], 0)
+        self.assertGreater(stats["timings"]["total"]["max"], 0)
+
+    def test_modules(self):
+        def write(fname, code):
+            with open(fname, "w") as f:
+                f.write(code)
+            stat = os.stat(fname)
+            os.utime(fname, ns=(stat.st_atime_ns,
+                                stat.st_mtime_ns + 10 ** 9))
+
+        # Modules with the same file name in different directories are kept
+        # apart.
+        other = os.path.join(self.path, "other")
+        os.mkdir(other)
+        write(os.path.join(other, "structs_gen.py"),
+              GENERATOR.replace('"count.txt"', '"other.txt"'))
+        self.assertEqual(self.generate()["files"],
+                         ["count.txt", "structs.go"])
+        response = self.generate(module=os.path.join(other, "structs_gen.py"),
+                                 outdir=other)
+        self.assertEqual(response["files"], ["other.txt", "structs.go"])
+        self.assertFalse(os.path.exists(os.path.join(other, "count.txt")))
+
+        # File generators removed from a module are gone once it is loaded
+        # again.
+        write(self.module, GENERATOR[:GENERATOR.index("@gen(model=model, "
+                                                      'fname="count.txt")')])
+        response = self.generate()
+        self.assertEqual(response["cached"]["module"], False)
+        self.assertEqual(response["files"], ["structs.go"])
+
+    def test_errors(self):
+        response = self.generate(model=os.path.join(self.path, "missing"))
+        self.assertFalse(response["ok"])
+        self.assertIn("FileNotFoundError", response["error"])
+        response = request(self.socket, {"command": "restart"})
+        self.assertEqual(response["error"], "Unknown command 'restart'")
+        self.assertEqual(
+            request(self.socket, {"command": "stats"})["stats"]["errors"], 1)
+
+        with socket.socket(socket.AF_UNIX) as s:
+            s.connect(self.socket)
+            with s.makefile("rwb") as f:
+                f.write(b"[]\n")
+                f.flush()
+                response = json.loads(f.readline())
+        self.assertIn("Invalid request", response["error"])
+
+        # Sockets of running servers are not taken over.
+        with self.assertRaises(OSError):
+            Server(self.socket)
+
+    def test_cli(self):
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout(stdout), \
+                contextlib.redirect_stderr(io.StringIO()):
+            code = main(["client", self.socket, self.module, "-m",
+                         self.model, "-o", self.outdir, "-t", "structs.go"])
+        self.assertEqual(code, 0)
+        self.assertEqual(stdout.getvalue(), "structs.go\n")
+        self.assertEqual(self.read("structs.go"),
+                         "package main\n\ntype s0 struct {\n    id int\n}")
+
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout(stdout):
+            main(["client", self.socket, "--stats"])
+        self.assertIn("1 requests (0 failed)", stdout.getvalue())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,358 @@
+import mmap
+import struct
+
+from .model import (Model, ModelError, _has_items_method, _is_enumerable,
+                    _is_model, _raw)
+from .views import ReadOnlyMapping, ReadOnlySequence
+
+# A serialized model starts with a header (magic and offset of the root
+# value), followed by values. Each value is a one-byte tag and its payload:
+#
+#   N, T, F          None, True, False
+#   I                int64
+#   J                u32 length + decimal digits (ints not fitting int64)
+#   D                float64
+#   S                u32 length + UTF-8 bytes
+#   L                u32 count + count u32 offsets of the elements
+#   M                u32 count + count (u32 key offset, u32 value offset)
+#                    entries in order + count u32 entry indexes, sorted by
+#                    key (string keys only), for binary search
+#
+# Values are written before the containers holding them, and identical
+# strings are only written once.
+_magic = b"FSM1"
+_header = struct.Struct("<4sI")
+_u32 = struct.Struct("<I")
+_i64 = struct.Struct("<q")
+_f64 = struct.Struct("<d")
+_pair = struct.Struct("<II")
+_max_offset = 2 ** 32 - 1
+
+
+class _Writer:
+    def __init__(self):
+        self.data = bytearray(_header.size)
+        self.strings = {}
+
+    def _offset(self):
+        offset = len(self.data)
+        if offset > _max_offset:
+            raise ModelError("Model is too large to be serialized")
+        return offset
+
+    def write(self, value):
+        """
+        write serializes value (and everything nested in it) and returns its
+        offset.
+        """
+        if isinstance(value, str):
+            offset = self.strings.get(value)
+            if offset is None:
+                offset = self._offset()
+                data = value.encode("utf-8", "surrogatepass")
+                self.data += b"S" + _u32.pack(len(data)) + data
+                self.strings[value] = offset
+            return offset
+        elif value is None:
+            offset = self._offset()
+            self.data += b"N"
+        elif isinstance(value, bool):
+            offset = self._offset()
+            self.data += b"T" if value else b"F"
+        elif isinstance(value, int):
+            offset = self._offset()
+            if -2 ** 63 <= value < 2 ** 63:
+                self.data += b"I" + _i64.pack(value)
+            else:
+                data = str(int(value)).encode()
+                self.data += b"J" + _u32.pack(len(data)) + data
+        elif isinstance(value, float):
+            offset = self._offset()
+            self.data += b"D" + _f64.pack(value)
+        elif _has_items_method(value):
+            entries = [(self.write(k), self.write(v), k)
+                       for k, v in value.items()]
+            order = sorted((i for i, (_, _, k) in enumerate(entries)
+                            if isinstance(k, str)),
+                           key=lambda i: entries[i][2].encode(
+                               "utf-8", "surrogatepass"))
+            offset = self._offset()
+            self.data += b"M" + _u32.pack(len(entries))
+            for koffset, voffset, _ in entries:
+                self.data += _u32.pack(koffset) + _u32.pack(voffset)
+            self.data += _u32.pack(len(order))
+            for i in order:
+                self.data += _u32.pack(i)
+        elif _is_enumerable(value) and not isinstance(value, bytes):
+            offsets = [self.write(v) for v in value]
+            offset = self._offset()
+            self.data += b"L" + _u32.pack(len(offsets))
+            for element in offsets:
+                self.data += _u32.pack(element)
+        else:
+            raise ModelError(
+                "Cannot serialize value of type '{}'".format(
+                    type(value).__name__))
+        return offset
+
+
+def dump(model):
+    """
+    dump serializes model (a Model or a plain value made of dicts, lists,
+    strings, numbers, booleans and None) into bytes that can be loaded with
+    view, load or attach.
+    """
+    if _is_model(model):
+        model = _raw(model)
+    writer = _Writer()
+    root = writer.write(model)
+    writer.data[:_header.size] = _header.pack(_magic, root)
+    return bytes(writer.data)
+
+
+class _Buffer:
+    """
+    _Buffer holds the memory of a serialized model, along with the object
+    owning that memory (which must be kept alive while views exist).
+    """
+
+    def __init__(self, data, owner=None):
+        # Reusing memoryviews avoids exporting the memory once more, which
+        # would prevent SharedMemory from closing when collected.
+        if not isinstance(data, memoryview):
+            data = memoryview(data)
+        self.data = data
+        self.owner = owner
+
+
+def _decode(buf, offset):
+    data = buf.data
+    tag = data[offset]
+    if tag == 0x53:  # S
+        size = _u32.unpack_from(data, offset + 1)[0]
+        return str(data[offset + 5:offset + 5 + size], "utf-8",
+                   "surrogatepass")
+    elif tag == 0x4d:  # M
+        return SharedDict(buf, offset)
+    elif tag == 0x4c:  # L
+        return SharedList(buf, offset)
+    elif tag == 0x49:  # I
+        return _i64.unpack_from(data, offset + 1)[0]
+    elif tag == 0x44:  # D
+        return _f64.unpack_from(data, offset + 1)[0]
+    elif tag == 0x4e:  # N
+        return None
+    elif tag == 0x54:  # T
+        return True
+    elif tag == 0x46:  # F
+        return False
+    elif tag == 0x4a:  # J
+        size = _u32.unpack_from(data, offset + 1)[0]
+        return int(bytes(data[offset + 5:offset + 5 + size]))
+    raise ModelError("Invalid serialized model")
+
+
+def _key_bytes(buf, offset):
+    size = _u32.unpack_from(buf.data, offset + 1)[0]
+    return buf.data[offset + 5:offset + 5 + size]
+
+
+class SharedDict(ReadOnlyMapping):
+    """
+    SharedDict is a read-only dict-like view over a serialized dict. Values
+    are decoded on access, without copying the underlying memory. String
+    keys are found with a binary search.
+    """
+
+    _state = ("_buf", "_offset", "_count")
+
+    def _open(self, buf, offset):
+        self._buf = buf
+        self._offset = offset
+        self._count = _u32.unpack_from(buf.data, offset + 1)[0]
+
+    def _entry(self, i):
+        return _pair.unpack_from(self._buf.data, self._offset + 5 + 8 * i)
+
+    def _sorted(self, i):
+        base = self._offset + 5 + 8 * self._count + 4
+        return _u32.unpack_from(self._buf.data, base + 4 * i)[0]
+
+    def _find(self, key):
+        if isinstance(key, str):
+            target = key.encode("utf-8", "surrogatepass")
+            base = self._offset + 5 + 8 * self._count
+            count = _u32.unpack_from(self._buf.data, base)[0]
+            lo, hi = 0, count
+            while lo < hi:
+                mid = (lo + hi) // 2
+                i = self._sorted(mid)
+                koffset, voffset = self._entry(i)
+                candidate = _key_bytes(self._buf, koffset)
+                if candidate == target:
+                    return voffset
+                elif candidate.tobytes() < target:
+                    lo = mid + 1
+                else:
+                    hi = mid
+            return None
+        for i in range(self._count):
+            koffset, voffset = self._entry(i)
+            if _decode(self._buf, koffset) == key:
+                return voffset
+        return None
+
+    def __getitem__(self, key):
+        offset = self._find(key)
+        if offset is None:
+            raise KeyError(key)
+        return _decode(self._buf, offset)
+
+    def __contains__(self, key):
+        return self._find(key) is not None
+
+    def __iter__(self):
+        for i in range(self._count):
+            yield _decode(self._buf, self._entry(i)[0])
+
+    def _items(self):
+        for i in range(self._count):
+            koffset, voffset = self._entry(i)
+            yield _decode(self._buf, koffset), _decode(self._buf, voffset)
+
+
+class SharedList(ReadOnlySequence):
+    """
+    SharedList is a read-only list-like view over a serialized list. Elements
+    are decoded on access, without copying the underlying memory.
+    """
+
+    _state = ("_buf", "_offset", "_count")
+
+    def _open(self, buf, offset):
+        self._buf = buf
+        self._offset = offset
+        self._count = _u32.unpack_from(buf.data, offset + 1)[0]
+
+    def _element(self, index):
+        offset = _u32.unpack_from(self._buf.data,
+                                  self._offset + 5 + 4 * index)[0]
+        return _decode(self._buf, offset)
+
+
+def view(data, name="model", refprefix="#", _owner=None, **kwargs):
+    """
+    view returns a Model over data (bytes or any buffer holding a model
+    serialized with dump), without copying it. Other keyword arguments are
+    passed to Model.
+    """
+    buf = _Buffer(data, _owner)
+    magic, root = _header.unpack_from(buf.data, 0)
+    if magic != _magic:
+        raise ModelError("Invalid serialized model")
+    return Model(name, _decode(buf, root), refprefix, **kwargs)
+
+
+def save(model, fname):
+    """
+    save serializes model (see dump) to the file at fname.
+    """
+    with open(fname, "wb") as f:
+        f.write(dump(model))
+
+
+def load(fname, name="model", refprefix="#", **kwargs):
+    """
+    load returns a Model over the serialized model in the file at fname,
+    which is memory-mapped, so processes loading the same file share its
+    memory.
+    """
+    with open(fname, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return view(mapped, name, refprefix, _owner=mapped, **kwargs)
+
+
+# _created holds the names of the shared memory blocks created by this process
+# and not yet unlinked.
+_created = set()
+
+
+def _shared_memory():
+    try:
+        from multiprocessing import shared_memory
+    except ImportError:
+        raise ImportError("Python 3.8+ is required to share models in "
+                          "shared memory")
+    return shared_memory
+
+
+class SharedModel:
+    """
+    SharedModel holds a model serialized into shared memory (see share).
+    Other processes can attach to it by name. The creating process should
+    call unlink once the model is no longer needed, which destroys the
+    shared memory.
+    """
+
+    def __init__(self, model, name=None):
+        shared_memory = _shared_memory()
+        data = dump(model)
+        self.shm = shared_memory.SharedMemory(name, create=True,
+                                              size=len(data))
+        self.shm.buf[:len(data)] = data
+        self.name = self.shm.name
+        self.size = len(data)
+        _created.add(self.name)
+
+    def close(self):
+        self.shm.close()
+
+    def unlink(self):
+        self.shm.unlink()
+        _created.discard(self.name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        self.unlink()
+
+
+def share(model, name=None):
+    """
+    share serializes model (see dump) into a new block of shared memory, and
+    returns a SharedModel for it. The block is named name, or gets a random
+    name if name is None. Shared memory requires Python 3.8+.
+    """
+    return SharedModel(model, name)
+
+
+def attach(name, model_name="model", refprefix="#", **kwargs):
+    """
+    attach returns a Model over the model shared (see share) with the given
+    shared memory name, without copying it. Other keyword arguments are
+    passed to Model. Shared memory requires Python 3.8+.
+    """
+    shared_memory = _shared_memory()
+
+    try:
+        shm = shared_memory.SharedMemory(name, track=False)
+    except TypeError:
+        # Before Python 3.13, attaching always registers the memory with the
+        # resource tracker, which would destroy it when this process exits.
+        # Processes started by multiprocessing (and the creating process)
+        # share the tracker of the creating process, where the memory is
+        # registered anyway, so it is only unregistered in other processes.
+        import multiprocessing
+        from multiprocessing import resource_tracker
+
+        shm = shared_memory.SharedMemory(name)
+        if (multiprocessing.parent_process() is None
+                and shm.name not in _created):
+            resource_tracker.unregister(shm._name, "shared_memory")
+    return view(shm.buf, model_name, refprefix, _owner=shm, **kwargs)
+
+
+__all__ = ("dump", "view", "save", "load", "share", "attach", "SharedModel",
+           "SharedDict", "SharedList")
@@ -0,0 +1,122 @@
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from .model import Model, ModelError
+from .shared import (SharedDict, SharedList, attach, dump, load, save, share,
+                     view)
+
+DATA = {
+    "name": "root",
+    "count": 3,
+    "big": 2 ** 70,
+    "ratio": 0.5,
+    "enabled": True,
+    "disabled": False,
+    "nothing": None,
+    "structs": {
+        "b": {"fields": ["x", "y"]},
+        "a": {"fields": ["z"], "parent": "#/structs/b"},
+        "ç": {"fields": []},
+    },
+    "list": [1, "two", {"three": 3}],
+}
+
+
+def _worker(name):
+    model = attach(name)
+    return str(model.select("/structs/a/parent->/fields/1")), \
+        model.fingerprint()
+
+
+class TestShared(unittest.TestCase):
+    def test_roundtrip(self):
+        model = view(dump(Model("model", DATA)))
+        self.assertIsInstance(model, SharedDict)
+        self.assertEqual(model, DATA)
+        self.assertEqual(model.select("big"), 2 ** 70)
+        self.assertEqual(model.select("ratio"), 0.5)
+        self.assertIs(model.select("enabled") == True, True)  # noqa: E712
+        self.assertEqual(model.select("nothing"), None)
+        self.assertEqual(list(model.select("structs")), ["b", "a", "ç"])
+        self.assertEqual(model.select("structs/ç/fields"), [])
+
+    def test_select(self):
+        model = view(dump(DATA))
+        self.assertIsInstance(model.select("list"), SharedList)
+        self.assertEqual(model.select("list/1"), "two")
+        self.assertEqual(model.select("list/-1/three"), 3)
+        self.assertEqual(model.select("structs/a/parent->/fields/0"), "x")
+        self.assertEqual([s.name for s in model.select("structs/*")],
+                         ["b", "a", "ç"])
+        self.assertEqual(model.select("structs/*/fields"),
+                         (["x", "y"], ["z"], []))
+        self.assertEqual(model.select("structs/c", "default"), "default")
+        with self.assertRaises(ModelError):
+            model.select("structs/c")
+        with self.assertRaises(ModelError):
+            model.select("list/name")
+
+    def test_fingerprint(self):
+        model = Model("model", DATA)
+        shared = view(dump(model))
+        self.assertEqual(shared.fingerprint(), model.fingerprint())
+        self.assertEqual(shared.select("structs/a").fingerprint(),
+                         model.select("structs/a").fingerprint())
+        self.assertEqual(model.diff(shared), set())
+
+    def test_invalid(self):
+        with self.assertRaises(ModelError):
+            view(b"FSM0\0\0\0\0")
+        with self.assertRaises(ModelError):
+            dump({"value": object()})
+
+    def test_file(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fname = os.path.join(tmpdir, "model.fsm")
+            save(Model("model", DATA), fname)
+            model = load(fname, "loaded")
+            self.assertEqual(model.name, "loaded")
+            self.assertEqual(model.select("structs/a/parent->/fields/1"), "y")
+            del model
+
+    @unittest.skipIf(sys.version_info < (3, 8),
+                     "shared memory requires Python 3.8+")
+    def test_shared_memory(self):
+        with share(DATA) as shared:
+            model = attach(shared.name)
+            self.assertEqual(model, DATA)
+            ctx = multiprocessing.get_context("spawn")
+            with ctx.Pool(1) as pool:
+                value, fingerprint = pool.apply(_worker, (shared.name,))
+            self.assertEqual(value, "y")
+            self.assertEqual(fingerprint, Model("model", DATA).fingerprint())
+            del model
+
+    @unittest.skipIf(sys.version_info < (3, 8),
+                     "shared memory requires Python 3.8+")
+    def test_shared_memory_subprocess(self):
+        # Processes not started by multiprocessing can attach too, without
+        # destroying the shared memory when they exit.
+        code = ("import sys; from fstringen.shared import attach; "
+                "print(attach(sys.argv[1]).select('/list/1'))")
+        cwd = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        with share(DATA) as shared:
+            for _ in range(2):
+                proc = subprocess.run(
+                    [sys.executable, "-c", code, shared.name], cwd=cwd,
+                    stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                    universal_newlines=True)
+                self.assertEqual(proc.returncode, 0, proc.stderr)
+                self.assertEqual(proc.stdout, "two\n")
+                self.assertEqual(proc.stderr, "")
+            model = attach(shared.name)
+            self.assertEqual(model, DATA)
+            del model
+
+
+if __name__ == "__main__":
+    unittest.main()
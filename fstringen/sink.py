@@ -0,0 +1,282 @@
+import io
+import os
+import secrets
+import stat
+import tarfile
+import threading
+import time
+import zipfile
+
+
+class SinkError(Exception):
+    """
+    SinkError represents an error in writing generated files to a Sink.
+    """
+
+    pass
+
+
+_fsync_policies = ("never", "file", "commit")
+
+
+class Sink:
+    """
+    Sink represents a destination for the files written by file generators.
+    Writes are buffered in memory and handed to the destination in batches of
+    batch_size files (or all at once if batch_size is None). Nothing is
+    visible at the destination until commit is called, and abort discards
+    everything written since the last commit. A Sink can be used as a context
+    manager, committing on success and aborting on error. Sinks can be shared
+    by many threads.
+    """
+
+    def __init__(self, batch_size=None, encoding="utf-8"):
+        self.batch_size = batch_size
+        self.encoding = encoding
+        self._pending = []
+        self._lock = threading.RLock()
+
+    def write(self, fname, data):
+        """
+        write queues data (a str or bytes) to be written to fname.
+        """
+        if isinstance(data, str):
+            data = data.encode(self.encoding)
+        with self._lock:
+            self._pending.append((fname, data))
+            if self.batch_size and len(self._pending) >= self.batch_size:
+                self.flush()
+
+    def flush(self):
+        """
+        flush hands all queued writes to the destination as a single batch.
+        Flushed files are still only visible after commit.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, []
+            if pending:
+                self._write_batch(pending)
+
+    def commit(self):
+        """
+        commit flushes pending writes and makes all of them visible at the
+        destination.
+        """
+        with self._lock:
+            self.flush()
+            self._commit()
+
+    def abort(self):
+        """
+        abort discards all writes since the last commit.
+        """
+        with self._lock:
+            self._pending = []
+            self._abort()
+
+    def _write_batch(self, files):
+        raise NotImplementedError
+
+    def _commit(self):
+        pass
+
+    def _abort(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
+
+
+class DirectorySink(Sink):
+    """
+    DirectorySink writes files under the directory at path. Each file is first
+    written to a temporary file next to its destination, and all temporary
+    files are atomically renamed into place on commit, so an interrupted
+    generation never leaves half-written files behind.
+
+    Files keep the permissions of the files they replace, and new files get
+    the default permissions (as set by the umask).
+
+    fsync controls durability: "never" leaves flushing to the OS, "file"
+    syncs every file as it is written, and "commit" syncs all files (and
+    their directories) once, right before and after they are renamed.
+    """
+
+    def __init__(self, path=".", fsync="never", batch_size=None,
+                 encoding="utf-8"):
+        if fsync not in _fsync_policies:
+            raise SinkError("Invalid fsync policy '{}', expected one of {}"
+                            .format(fsync, ", ".join(_fsync_policies)))
+        super().__init__(batch_size, encoding)
+        self.path = path
+        self.fsync = fsync
+        self._staged = []
+
+    def _write_batch(self, files):
+        for fname, data in files:
+            dest = os.path.join(self.path, fname)
+            dirname = os.path.dirname(dest) or "."
+            os.makedirs(dirname, exist_ok=True)
+            fd, tmp = _create_temp(dirname, os.path.basename(dest))
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+                    if self.fsync == "file":
+                        f.flush()
+                        os.fsync(f.fileno())
+                # Temporary files are created with the default permissions,
+                # but replaced files keep their own.
+                try:
+                    os.chmod(tmp, stat.S_IMODE(os.stat(dest).st_mode))
+                except FileNotFoundError:
+                    pass
+            except OSError as e:
+                os.unlink(tmp)
+                raise SinkError("Could not write '{}': {}".format(dest, e))
+            self._staged.append((tmp, dest))
+
+    def _commit(self):
+        staged, self._staged = self._staged, []
+        if self.fsync == "commit":
+            for tmp, _ in staged:
+                _fsync_path(tmp, os.O_RDONLY)
+        for tmp, dest in staged:
+            os.replace(tmp, dest)
+        if self.fsync == "commit":
+            dirnames = {os.path.dirname(dest) or "." for _, dest in staged}
+            for dirname in dirnames:
+                _fsync_path(dirname,
+                            os.O_RDONLY | getattr(os, "O_DIRECTORY", 0))
+
+    def _abort(self):
+        staged, self._staged = self._staged, []
+        for tmp, _ in staged:
+            try:
+                os.unlink(tmp)
+            except FileNotFoundError:
+                pass
+
+
+def _create_temp(dirname, basename):
+    """
+    _create_temp creates a new temporary file for basename in dirname,
+    returning its descriptor and path. Unlike tempfile.mkstemp, the file gets
+    the default permissions for new files (as set by the umask).
+    """
+    while True:
+        tmp = os.path.join(dirname, ".{}.{}.tmp".format(
+            basename, secrets.token_hex(4)))
+        try:
+            return os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL |
+                           getattr(os, "O_BINARY", 0), 0o666), tmp
+        except FileExistsError:
+            continue
+
+
+def _fsync_path(path, flags):
+    try:
+        fd = os.open(path, flags)
+    except OSError:
+        # Some platforms (e.g., Windows) cannot open directories.
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class ArchiveSink(Sink):
+    """
+    ArchiveSink writes files into a zip or tar archive at path. The format is
+    "zip", "tar", "gztar", "bztar" or "xztar". The archive is built in a
+    temporary file and atomically moved to path on commit. Each commit
+    replaces the archive with the files written since the previous one,
+    while commits with nothing written leave it as it is.
+    """
+
+    _tar_modes = {"tar": "w", "gztar": "w:gz", "bztar": "w:bz2",
+                  "xztar": "w:xz"}
+
+    def __init__(self, path, format="zip", batch_size=None,
+                 encoding="utf-8"):
+        if format != "zip" and format not in self._tar_modes:
+            raise SinkError("Invalid archive format '{}'".format(format))
+        super().__init__(batch_size, encoding)
+        self.path = path
+        self.format = format
+        self._tmp = None
+        self._archive = None
+
+    def _open(self):
+        dirname = os.path.dirname(self.path) or "."
+        fd, self._tmp = _create_temp(dirname, os.path.basename(self.path))
+        os.close(fd)
+        if self.format == "zip":
+            self._archive = zipfile.ZipFile(self._tmp, "w",
+                                            zipfile.ZIP_DEFLATED)
+        else:
+            self._archive = tarfile.open(self._tmp,
+                                         self._tar_modes[self.format])
+
+    def _write_batch(self, files):
+        if self._archive is None:
+            self._open()
+        for fname, data in files:
+            if self.format == "zip":
+                self._archive.writestr(fname, data)
+            else:
+                info = tarfile.TarInfo(fname)
+                info.size = len(data)
+                info.mtime = int(time.time())
+                self._archive.addfile(info, io.BytesIO(data))
+
+    def _commit(self):
+        if self._archive is None:
+            if os.path.exists(self.path):
+                # Nothing was written since the last commit, so the archive
+                # at path is already complete.
+                return
+            self._open()
+        self._archive.close()
+        os.replace(self._tmp, self.path)
+        self._archive = None
+        self._tmp = None
+
+    def _abort(self):
+        if self._archive is not None:
+            self._archive.close()
+            os.unlink(self._tmp)
+        self._archive = None
+        self._tmp = None
+
+
+class MemorySink(Sink):
+    """
+    MemorySink keeps committed files in the files dict, mapping file names to
+    their decoded contents. It is mostly useful for testing generators.
+    """
+
+    def __init__(self, batch_size=None, encoding="utf-8"):
+        super().__init__(batch_size, encoding)
+        self.files = {}
+        self._staged = []
+
+    def _write_batch(self, files):
+        self._staged.extend(files)
+
+    def _commit(self):
+        staged, self._staged = self._staged, []
+        for fname, data in staged:
+            self.files[fname] = data.decode(self.encoding)
+
+    def _abort(self):
+        self._staged = []
+
+
+__all__ = "Sink", "DirectorySink", "ArchiveSink", "MemorySink", "SinkError"
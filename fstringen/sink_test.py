@@ -0,0 +1,122 @@
+import os
+import stat
+import tarfile
+import tempfile
+import unittest
+import zipfile
+
+from .generator import gen, generate
+from .generator_test import IsolatedOutput
+from .model import Model
+from .sink import ArchiveSink, DirectorySink, MemorySink, SinkError
+
+
+class TestSink(IsolatedOutput, unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = self.tmpdir.name
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_directory(self):
+        sink = DirectorySink(self.path, batch_size=2)
+        sink.write("a.txt", "a")
+        sink.write("sub/b.txt", "b")
+        sink.write("c.txt", b"c")
+        # Nothing is visible before commit, even for flushed batches.
+        self.assertFalse(os.path.exists(os.path.join(self.path, "a.txt")))
+        sink.commit()
+
+        for fname, content in (("a.txt", "a"), ("sub/b.txt", "b"),
+                               ("c.txt", "c")):
+            with open(os.path.join(self.path, fname)) as f:
+                self.assertEqual(f.read(), content)
+        # No temporary files are left behind.
+        self.assertEqual(sorted(os.listdir(self.path)),
+                         ["a.txt", "c.txt", "sub"])
+
+    def test_directory_abort(self):
+        with open(os.path.join(self.path, "a.txt"), "w") as f:
+            f.write("old")
+
+        with self.assertRaises(RuntimeError):
+            with DirectorySink(self.path, fsync="file", batch_size=1) as sink:
+                sink.write("a.txt", "new")
+                sink.write("b.txt", "new")
+                raise RuntimeError("generation failed")
+
+        with open(os.path.join(self.path, "a.txt")) as f:
+            self.assertEqual(f.read(), "old")
+        self.assertEqual(os.listdir(self.path), ["a.txt"])
+
+    @unittest.skipIf(os.name != "posix", "POSIX permissions unavailable")
+    def test_directory_permissions(self):
+        existing = os.path.join(self.path, "existing.sh")
+        with open(existing, "w") as f:
+            f.write("old")
+        os.chmod(existing, 0o750)
+
+        umask = os.umask(0o022)
+        try:
+            with DirectorySink(self.path) as sink:
+                sink.write("new.txt", "new")
+                sink.write("existing.sh", "new")
+        finally:
+            os.umask(umask)
+
+        self.assertEqual(
+            stat.S_IMODE(os.stat(os.path.join(self.path, "new.txt")).st_mode),
+            0o644)
+        self.assertEqual(stat.S_IMODE(os.stat(existing).st_mode), 0o750)
+
+    def test_directory_fsync_policy(self):
+        DirectorySink(self.path, fsync="never")
+        self.assertRaisesRegex(SinkError, "Invalid fsync policy 'always'.*",
+                               DirectorySink, self.path, fsync="always")
+
+    def test_zip(self):
+        fname = os.path.join(self.path, "out.zip")
+        with ArchiveSink(fname, batch_size=1) as sink:
+            sink.write("a.txt", "a")
+            sink.write("sub/b.txt", "b")
+            self.assertFalse(os.path.exists(fname))
+
+        with zipfile.ZipFile(fname) as z:
+            self.assertEqual(z.namelist(), ["a.txt", "sub/b.txt"])
+            self.assertEqual(z.read("sub/b.txt"), b"b")
+
+    def test_archive_generate(self):
+        m = Model("test", {"week": ["mon", "tue"]})
+        fname = os.path.join(self.path, "out.zip")
+
+        @gen(model=m, fname="week.txt")
+        def gen_week(model):
+            return f"""*{model.select("/week")}*"""
+
+        # Committing again on exit keeps the files committed by generate.
+        with ArchiveSink(fname) as sink:
+            generate(sink)
+        with zipfile.ZipFile(fname) as z:
+            self.assertEqual(z.namelist(), ["week.txt"])
+            self.assertEqual(z.read("week.txt"), b"mon\ntue")
+
+    def test_tar(self):
+        fname = os.path.join(self.path, "out.tar.gz")
+        with ArchiveSink(fname, format="gztar") as sink:
+            sink.write("a.txt", "a")
+
+        with tarfile.open(fname) as t:
+            self.assertEqual(t.getnames(), ["a.txt"])
+            self.assertEqual(t.extractfile("a.txt").read(), b"a")
+
+        self.assertRaisesRegex(SinkError, "Invalid archive format 'rar'",
+                               ArchiveSink, fname, format="rar")
+
+    def test_memory(self):
+        sink = MemorySink()
+        sink.write("a.txt", "a")
+        sink.abort()
+        sink.write("b.txt", "b")
+        sink.commit()
+        self.assertEqual(sink.files, {"b.txt": "b"})
@@ -0,0 +1,427 @@
+import collections
+import os
+import sqlite3
+import threading
+
+from .model import (Model, ModelError, _has_items_method, _is_enumerable,
+                    _is_model, _raw)
+from .views import ReadOnlyMapping, ReadOnlySequence
+
+# Every value is a row in the nodes table. Containers ("M" for dict-likes,
+# "L" for enumerables) hold their number of elements in value, and their
+# elements point to them through parent, in pos order. Elements of dicts are
+# found by key, and elements of lists by pos (their key is their index).
+# Scalars are "S" (str), "I" (int), "J" (int not fitting in 64 bits, as
+# text), "D" (float), "B" (bool) and "N" (None).
+_schema = """
+CREATE TABLE nodes (
+    id INTEGER PRIMARY KEY,
+    parent INTEGER,
+    key,
+    pos INTEGER,
+    kind TEXT NOT NULL,
+    value
+);
+CREATE INDEX nodes_parent_key ON nodes (parent, key);
+CREATE INDEX nodes_parent_pos ON nodes (parent, pos);
+"""
+
+# _root is the id of the root value.
+_root = 1
+# _page_size is the number of elements read at once when iterating over
+# containers.
+_page_size = 256
+
+
+def _row(value):
+    """
+    _row returns the kind and the stored value for value.
+    """
+    if isinstance(value, str):
+        return "S", value
+    elif value is None:
+        return "N", None
+    elif isinstance(value, bool):
+        return "B", int(value)
+    elif isinstance(value, int):
+        if -2 ** 63 <= value < 2 ** 63:
+            return "I", int(value)
+        return "J", str(int(value))
+    elif isinstance(value, float):
+        return "D", float(value)
+    elif _has_items_method(value):
+        return "M", len(value)
+    elif _is_enumerable(value) and not isinstance(value, bytes):
+        return "L", len(value)
+    raise ModelError(
+        "Cannot store value of type '{}'".format(type(value).__name__))
+
+
+class _Writer:
+    """
+    _Writer inserts values into the nodes table of conn, batch_size rows at a
+    time. Containers may be inserted before their elements are known, and
+    get their number of elements later (see count).
+    """
+
+    def __init__(self, conn, batch_size):
+        self.conn = conn
+        self.batch_size = batch_size
+        self.next_id = _root
+        self._rows = []
+        self._counts = []
+
+    def _insert(self, parent, key, pos, kind, stored):
+        node = self.next_id
+        self.next_id += 1
+        self._rows.append((node, parent, key, pos, kind, stored))
+        if len(self._rows) >= self.batch_size:
+            self.flush()
+        return node
+
+    def container(self, parent, key, pos, kind):
+        """
+        container inserts an empty container of the given kind as the
+        element of parent at key and pos, returning its id.
+        """
+        return self._insert(parent, key, pos, kind, 0)
+
+    def count(self, node, count):
+        """
+        count sets the number of elements of the container node.
+        """
+        self._counts.append((count, node))
+        if len(self._counts) >= self.batch_size:
+            self.flush()
+
+    def add(self, parent, key, pos, value):
+        """
+        add inserts value, along with everything nested in it, as the
+        element of parent at key and pos.
+        """
+        kind, stored = _row(value)
+        node = self._insert(parent, key, pos, kind, stored)
+        stack = [(node, value, kind)]
+        while stack:
+            parent, value, kind = stack.pop()
+            if kind == "M":
+                items = value.items()
+            elif kind == "L":
+                items = ((str(i), v) for i, v in enumerate(value))
+            else:
+                continue
+            for pos, (key, element) in enumerate(items):
+                kind, stored = _row(element)
+                node = self._insert(parent, key, pos, kind, stored)
+                if kind in ("M", "L"):
+                    stack.append((node, element, kind))
+
+    def flush(self):
+        self.conn.executemany(
+            "INSERT INTO nodes VALUES (?, ?, ?, ?, ?, ?)", self._rows)
+        self.conn.executemany(
+            "UPDATE nodes SET value = ? WHERE id = ?", self._counts)
+        self._rows = []
+        self._counts = []
+
+
+def _build(fname, batch_size, fill):
+    """
+    _build creates a new database at fname (replacing any existing file), and
+    calls fill with a _Writer for it.
+    """
+    # The database is built next to fname and moved into place once
+    # complete, so a failed save leaves no partial database behind.
+    tmp = fname + ".tmp"
+    if os.path.exists(tmp):
+        os.unlink(tmp)
+
+    conn = sqlite3.connect(tmp)
+    try:
+        conn.executescript(_schema)
+        writer = _Writer(conn, batch_size)
+        fill(writer)
+        writer.flush()
+        conn.commit()
+    except BaseException:
+        conn.close()
+        os.unlink(tmp)
+        raise
+    conn.close()
+    os.replace(tmp, fname)
+
+
+def save(model, fname, batch_size=10000):
+    """
+    save stores model (a Model or a plain value made of dicts, lists,
+    strings, numbers, booleans and None) into a new SQLite database at fname,
+    replacing any existing file. Rows are inserted in batches of batch_size.
+    The whole value must be in memory, see save_pairs otherwise.
+    """
+    if _is_model(model):
+        model = _raw(model)
+    _build(fname, batch_size,
+           lambda writer: writer.add(None, None, 0, model))
+
+
+def save_pairs(pairs, fname, batch_size=10000):
+    """
+    save_pairs is like save, but reads the value to store from pairs, an
+    iterable of (path, value) pairs, so it never needs to be fully in memory.
+    Each path is a tuple of keys (strings for dicts and integers for lists),
+    and dicts and lists along the way are created as needed. For instance,
+    {"a": [1, {}]} is described by (("a", 0), 1) and (("a", 1), {}).
+
+    Pairs must come in document order: once a pair is outside of a dict or
+    list, no more pairs can be inside it, and list elements must come in
+    order. Values are stored whole, so no pairs can be inside them either.
+    """
+    def fill(writer):
+        # opened holds [id, kind, key, count] for the containers along the
+        # path of the last pair, starting with the root.
+        opened = []
+        for path, value in pairs:
+            path = tuple(path)
+            if not path:
+                if opened or writer.next_id != _root:
+                    raise ModelError("The root value must be the only pair")
+                writer.add(None, None, 0, value)
+                continue
+            if not opened:
+                if writer.next_id != _root:
+                    raise ModelError("The root value must be the only pair")
+                opened.append([writer.container(None, None, 0,
+                                                _kind(path[0])),
+                               _kind(path[0]), None, 0])
+
+            depth = 1
+            while (depth < len(opened) and depth <= len(path)
+                   and opened[depth][2] == path[depth - 1]):
+                depth += 1
+            if depth > len(path):
+                raise ModelError("Path '{}' was already stored".format(
+                    _pair_path(path)))
+            while len(opened) > depth:
+                node, _, _, count = opened.pop()
+                writer.count(node, count)
+
+            for i in range(depth - 1, len(path)):
+                parent = opened[-1]
+                key = _key(parent, path[:i + 1])
+                if i == len(path) - 1:
+                    writer.add(parent[0], key, parent[3], value)
+                else:
+                    kind = _kind(path[i + 1])
+                    opened.append([writer.container(parent[0], key,
+                                                    parent[3], kind),
+                                   kind, path[i], 0])
+                parent[3] += 1
+        for node, _, _, count in opened:
+            writer.count(node, count)
+        if writer.next_id == _root:
+            raise ModelError("No value to store")
+
+    _build(fname, batch_size, fill)
+
+
+def _kind(key):
+    return "L" if isinstance(key, int) else "M"
+
+
+def _key(parent, path):
+    """
+    _key returns the stored key for the last key of path, checking that it
+    is the next element of parent (see save_pairs).
+    """
+    _, kind, _, count = parent
+    key = path[-1]
+    if kind == "L":
+        if not isinstance(key, int) or key != count:
+            raise ModelError(
+                "Expected list index {} at '{}'".format(count,
+                                                        _pair_path(path)))
+        return str(key)
+    if not isinstance(key, str):
+        raise ModelError("Expected string key at '{}'".format(
+            _pair_path(path)))
+    return key
+
+
+def _pair_path(path):
+    return "/" + "/".join(str(key) for key in path)
+
+
+class SQLiteStore:
+    """
+    SQLiteStore reads values from a database written by save. Elements are
+    fetched with indexed queries when accessed, and kept in a cache of up to
+    page_cache_size pages (each page being a single element looked up by
+    key, or a run of consecutive elements read while iterating), evicting the
+    least recently used ones. Stores can be shared by many threads.
+    """
+
+    def __init__(self, fname, page_cache_size=1024):
+        if not os.path.exists(fname):
+            raise ModelError("Could not find database '{}'".format(fname))
+        self.fname = fname
+        self.page_cache_size = page_cache_size
+        self.hits = 0
+        self.misses = 0
+        self._conn = sqlite3.connect(
+            "file:{}?mode=ro".format(fname), uri=True,
+            check_same_thread=False)
+        self._cache = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def close(self):
+        """
+        close closes the database. Values cannot be read from it anymore.
+        """
+        with self._lock:
+            self._conn.close()
+            self._cache.clear()
+
+    def _query(self, cache_key, sql, args):
+        with self._lock:
+            rows = self._cache.get(cache_key)
+            if rows is not None:
+                self.hits += 1
+                self._cache.move_to_end(cache_key)
+                return rows
+            self.misses += 1
+            rows = self._conn.execute(sql, args).fetchall()
+            self._cache[cache_key] = rows
+            if len(self._cache) > self.page_cache_size:
+                self._cache.popitem(last=False)
+            return rows
+
+    def _lookup(self, parent, key):
+        """
+        _lookup returns the (id, kind, value) row of the element of parent
+        with the given key, or None if there is no such element.
+        """
+        rows = self._query(
+            ("k", parent, key),
+            "SELECT id, kind, value FROM nodes WHERE parent = ? AND key = ?",
+            (parent, key))
+        return rows[0] if rows else None
+
+    def _page(self, parent, page):
+        """
+        _page returns the (id, key, kind, value) rows of the elements of
+        parent in the given page.
+        """
+        start = page * _page_size
+        return self._query(
+            ("p", parent, page),
+            "SELECT id, key, kind, value FROM nodes "
+            "WHERE parent = ? AND pos >= ? AND pos < ? ORDER BY pos",
+            (parent, start, start + _page_size))
+
+    def _elements(self, parent, count):
+        for page in range((count + _page_size - 1) // _page_size):
+            yield from self._page(parent, page)
+
+    def _decode(self, node, kind, value):
+        if kind == "S":
+            return value
+        elif kind == "M":
+            return SQLiteDict(self, node, value)
+        elif kind == "L":
+            return SQLiteList(self, node, value)
+        elif kind == "I":
+            return value
+        elif kind == "D":
+            return value
+        elif kind == "B":
+            return bool(value)
+        elif kind == "N":
+            return None
+        elif kind == "J":
+            return int(value)
+        raise ModelError("Invalid value kind '{}'".format(kind))
+
+    def root(self):
+        """
+        root returns the root value of the database.
+        """
+        rows = self._query(
+            ("r",), "SELECT id, kind, value FROM nodes WHERE id = ?",
+            (_root,))
+        if not rows:
+            raise ModelError("Database '{}' is empty".format(self.fname))
+        return self._decode(*rows[0])
+
+
+class SQLiteDict(ReadOnlyMapping):
+    """
+    SQLiteDict is a read-only dict-like view over a dict stored in a
+    SQLiteStore. Values are read from the database on access, and iterating
+    over its items reads them page by page.
+    """
+
+    _state = ("_store", "_node", "_count")
+
+    def _open(self, store, node, count):
+        self._store = store
+        self._node = node
+        self._count = count
+
+    def __getitem__(self, key):
+        try:
+            row = self._store._lookup(self._node, key)
+        except sqlite3.InterfaceError:
+            # Unsupported key types cannot be stored either.
+            raise KeyError(key)
+        if row is None:
+            raise KeyError(key)
+        return self._store._decode(*row)
+
+    def __iter__(self):
+        for _, key, _, _ in self._store._elements(self._node, self._count):
+            yield key
+
+    def _items(self):
+        for node, key, kind, value in self._store._elements(self._node,
+                                                            self._count):
+            yield key, self._store._decode(node, kind, value)
+
+
+class SQLiteList(ReadOnlySequence):
+    """
+    SQLiteList is a read-only list-like view over an enumerable stored in a
+    SQLiteStore. Elements are read from the database on access.
+    """
+
+    _state = ("_store", "_node", "_count")
+
+    def _open(self, store, node, count):
+        self._store = store
+        self._node = node
+        self._count = count
+
+    def _element(self, index):
+        page = self._store._page(self._node, index // _page_size)
+        node, _, kind, value = page[index % _page_size]
+        return self._store._decode(node, kind, value)
+
+    def __iter__(self):
+        for node, _, kind, value in self._store._elements(self._node,
+                                                          self._count):
+            yield self._store._decode(node, kind, value)
+
+
+def load(fname, name="model", refprefix="#", page_cache_size=1024,
+         **kwargs):
+    """
+    load returns a Model over the database at fname (see save), reading
+    values from it as they are selected, with a cache of page_cache_size
+    pages (see SQLiteStore). Other keyword arguments, such as cache_size, are
+    passed to Model.
+    """
+    store = SQLiteStore(fname, page_cache_size)
+    return Model(name, store.root(), refprefix, **kwargs)
+
+
+__all__ = ("save", "save_pairs", "load", "SQLiteStore", "SQLiteDict",
+           "SQLiteList")
@@ -0,0 +1,135 @@
+import os
+import tempfile
+import threading
+import unittest
+
+from .model import Model, ModelError
+from .sqlite import (SQLiteDict, SQLiteList, SQLiteStore, load, save,
+                     save_pairs)
+
+DATA = {
+    "name": "root",
+    "count": 3,
+    "big": 2 ** 70,
+    "ratio": 0.5,
+    "enabled": True,
+    "nothing": None,
+    "structs": {
+        "b": {"fields": ["x", "y"]},
+        "a": {"fields": ["z"], "parent": "#/structs/b"},
+    },
+    "list": [1, "two", {"three": 3}],
+    "empty": {"dict": {}, "list": []},
+}
+
+
+def pairs(value, path=()):
+    if isinstance(value, dict) and value:
+        for k, v in value.items():
+            yield from pairs(v, path + (k,))
+    elif isinstance(value, list) and value:
+        for i, v in enumerate(value):
+            yield from pairs(v, path + (i,))
+    else:
+        yield path, value
+
+
+class TestSQLite(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.fname = os.path.join(self.tmpdir.name, "model.db")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_roundtrip(self):
+        save(Model("model", DATA), self.fname)
+        model = load(self.fname, "loaded")
+        self.assertIsInstance(model, SQLiteDict)
+        self.assertEqual(model.name, "loaded")
+        self.assertEqual(model, DATA)
+        self.assertEqual(model.select("big"), 2 ** 70)
+        self.assertEqual(model.select("enabled"), True)
+        self.assertEqual(model.select("nothing"), None)
+        self.assertEqual(model.fingerprint(),
+                         Model("model", DATA).fingerprint())
+
+    def test_select(self):
+        save(DATA, self.fname)
+        model = load(self.fname)
+        self.assertIsInstance(model.select("list"), SQLiteList)
+        self.assertEqual(model.select("list/1"), "two")
+        self.assertEqual(model.select("list/-1/three"), 3)
+        self.assertEqual(model.select("structs/a/parent->/fields/1"), "y")
+        self.assertEqual([s.name for s in model.select("structs/*")],
+                         ["b", "a"])
+        self.assertEqual(model.select("structs/*/fields"), (["x", "y"], ["z"]))
+        self.assertTrue(model.has("structs/a/fields/0"))
+        self.assertFalse(model.has("structs/c"))
+        self.assertEqual(model.select("structs/c", "default"), "default")
+        with self.assertRaises(ModelError):
+            model.select("list/name")
+
+    def test_pages(self):
+        save({"items": list(range(1000))}, self.fname)
+        store = SQLiteStore(self.fname, page_cache_size=2)
+        model = Model("model", store.root())
+        self.assertEqual(model.select("items/999"), 999)
+        self.assertEqual(sum(model.raw("items")), sum(range(1000)))
+        self.assertEqual(len(model.select("items/*")), 1000)
+        self.assertLessEqual(len(store._cache), 2)
+
+        hits = store.hits
+        model.select("items/3")
+        model.select("items/4")
+        self.assertEqual(store.hits, hits + 2)
+
+    def test_threads(self):
+        save({"items": [{"value": i} for i in range(500)]}, self.fname)
+        model = load(self.fname, page_cache_size=4, cache_size=8)
+        # cache_size is passed to Model, so selections are cached.
+        self.assertEqual(model._store.page_cache_size, 4)
+        self.assertIs(model.select("items/0"), model.select("items/0"))
+        results = []
+
+        def work():
+            results.append(sum(model.raw("items/*/value")))
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [sum(range(500))] * 4)
+
+    def test_save_pairs(self):
+        save_pairs(pairs(DATA), self.fname, batch_size=3)
+        model = load(self.fname)
+        self.assertEqual(model, DATA)
+        self.assertEqual(model.select("structs/a/parent->/fields/1"), "y")
+        self.assertEqual(model.fingerprint(),
+                         Model("model", DATA).fingerprint())
+
+        # Values can be stored whole too.
+        save_pairs([(("a",), {"b": [1, 2]}), (("c", 0), 3)], self.fname)
+        self.assertEqual(load(self.fname), {"a": {"b": [1, 2]}, "c": [3]})
+        save_pairs([((), [1, 2])], self.fname)
+        self.assertEqual(load(self.fname), [1, 2])
+
+        for invalid in ([], [((), 1), (("a",), 2)], [(("a",), 1), ((), 2)],
+                        [(("a", "b"), 1), (("a",), 2)],
+                        [(("a", 1), 1)], [(("a", 0), 1), (("a", "b"), 2)],
+                        [((0,), 1), ((0,), 2)]):
+            with self.assertRaises(ModelError):
+                save_pairs(invalid, self.fname)
+            self.assertFalse(os.path.exists(self.fname + ".tmp"))
+
+    def test_invalid(self):
+        with self.assertRaises(ModelError):
+            load(self.fname)
+        with self.assertRaises(ModelError):
+            save({"value": object()}, self.fname)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+import operator
+from collections.abc import ItemsView, Mapping, Sequence, ValuesView
+
+
+class ReadOnlyMapping(Mapping):
+    """
+    ReadOnlyMapping is the base class of read-only dict-like views over
+    values stored elsewhere (e.g., in a buffer or a database), which are
+    decoded on access. Subclasses list the attributes holding their state in
+    _state (including _count, the number of items), and implement _open,
+    which sets them from the arguments of the constructor, __getitem__,
+    __iter__ and _items, which yields the (key, value) pairs in order.
+
+    Calling the class with another view makes a copy sharing the same
+    underlying data, which is how Models wrap views. items and values return
+    views iterating over _items, so large mappings are never decoded all at
+    once.
+    """
+
+    _state = ("_count",)
+
+    def __init__(self, *args):
+        if len(args) == 1 and isinstance(args[0], ReadOnlyMapping):
+            for name in args[0]._state:
+                setattr(self, name, getattr(args[0], name))
+        else:
+            self._open(*args)
+
+    def _open(self, *args):
+        raise NotImplementedError
+
+    def _items(self):
+        raise NotImplementedError
+
+    def __len__(self):
+        return self._count
+
+    def items(self):
+        return _ItemsView(self)
+
+    def values(self):
+        return _ValuesView(self)
+
+    def __repr__(self):
+        return repr(dict(self._items()))
+
+
+class _ItemsView(ItemsView):
+    def __iter__(self):
+        return self._mapping._items()
+
+
+class _ValuesView(ValuesView):
+    def __iter__(self):
+        return (value for _, value in self._mapping._items())
+
+
+class ReadOnlySequence(Sequence):
+    """
+    ReadOnlySequence is the base class of read-only list-like views over
+    values stored elsewhere, which are decoded on access. Subclasses list
+    the attributes holding their state in _state (including _count, the
+    number of elements), and implement _open, which sets them from the
+    arguments of the constructor, and _element, which returns the element at
+    a valid, non-negative index. Copies are made as for ReadOnlyMapping.
+    """
+
+    _state = ("_count",)
+
+    def __init__(self, *args):
+        if len(args) == 1 and isinstance(args[0], ReadOnlySequence):
+            for name in args[0]._state:
+                setattr(self, name, getattr(args[0], name))
+        else:
+            self._open(*args)
+
+    def _open(self, *args):
+        raise NotImplementedError
+
+    def _element(self, index):
+        raise NotImplementedError
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._element(i)
+                    for i in range(*index.indices(self._count))]
+        index = operator.index(index)
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError("list index out of range")
+        return self._element(index)
+
+    def __len__(self):
+        return self._count
+
+    def __eq__(self, other):
+        if isinstance(other, (str, bytes)) or not isinstance(other, Sequence):
+            return NotImplemented
+        return len(self) == len(other) and all(
+            a == b for a, b in zip(self, other))
+
+    __hash__ = None  # type: ignore
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+__all__ = "ReadOnlyMapping", "ReadOnlySequence"